@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Content-addressed store for files inserted into documents."""
+
+import os
+import shutil
+import hashlib
+import tempfile
+
+# directory of the store, next to the documents using it
+AssetDir = "assets"
+
+ReadChunk = 1024 * 1024
+
+# blobs are read-only, a hard-linked blob is shared by several projects
+# and an edit of one copy would change them all
+BlobMode = 0o444
+
+
+def fileDigest(fileName):
+    digest = hashlib.sha256()
+    with open(fileName, "rb") as fd:
+        for chunk in iter(lambda: fd.read(ReadChunk), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def relativeUrl(path, directory):
+    """Return path as a URL relative to directory"""
+    return os.path.relpath(path, directory).replace(os.sep, "/")
+
+
+def blobDigest(path):
+    """Return the digest the stored blob path is named after, None for other files"""
+    digest = os.path.splitext(os.path.basename(path))[0]
+    parent = os.path.dirname(path)
+    if (len(digest) == 64 and os.path.basename(parent) == digest[:2]
+            and os.path.basename(os.path.dirname(parent)) == AssetDir
+            and os.path.isfile(path)):
+        return digest
+    return None
+
+
+class AssetStore(object):
+    """
+    Store each distinct file once, named after the hash of its contents
+
+    Files live in root/<first two hex digits>/<sha256><extension>. A
+    store can be backed by a shared cache store, blobs are then
+    hard-linked between the two where the file system allows it, so
+    the same image used by several projects is kept on disk once. The
+    inserted file itself is always copied, it may change later. Blobs
+    are made read-only, see BlobMode.
+    """
+
+    def __init__(self, root, cache=None):
+        self.root = root
+        self.cache = cache
+
+    def pathFor(self, digest, extension):
+        return os.path.join(self.root, digest[:2], digest + extension.lower())
+
+    def add(self, fileName, digest=None):
+        """
+        Add fileName to the store and return the path of the stored copy
+
+        :param fileName: Path of the file
+        :param digest: sha256 hex digest of the file, if already known
+        """
+        digest = digest or fileDigest(fileName)
+        extension = os.path.splitext(fileName)[1]
+        path = self.pathFor(digest, extension)
+        if os.path.exists(path):
+            return path
+
+        if self.cache is not None:
+            # blobs are immutable, so they can share one inode
+            self._store(self.cache.add(fileName, digest), path, link=True)
+        else:
+            self._store(fileName, path)
+        return path
+
+    def _store(self, source, path, link=False):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        if link:
+            try:
+                os.link(source, path)
+                return
+            except (OSError, AttributeError):
+                pass
+        # copy to a temporary name first, a blob is never seen half-written
+        fd, tmpName = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(source, tmpName)
+            os.chmod(tmpName, BlobMode)
+            os.replace(tmpName, path)
+        except BaseException:
+            if os.path.exists(tmpName):
+                os.unlink(tmpName)
+            raise
+
+
+def storeForDocument(fileName, cache=None):
+    """Return the store shared by the documents in the directory of fileName"""
+    directory = os.path.dirname(os.path.abspath(fileName))
+    return AssetStore(os.path.join(directory, AssetDir), cache)
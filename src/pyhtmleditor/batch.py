@@ -0,0 +1,381 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Apply the editor normalizations to many files without a window
+
+Run headless with e.g.:
+
+    pyhtmleditor --batch --output out --exec removeFormat docs/
+    pyhtmleditor --batch --rewrite-links http://old/=https://new/ --inline-images a.html
+
+Files are loaded into offscreen pages, edited by the editing runtime
+and written back as the page serializes them.
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import weakref
+import argparse
+import collections
+import multiprocessing
+
+from PyQt5 import QtCore, QtWidgets
+
+from pyhtmleditor import jsruntime, schemehandler
+from pyhtmleditor.pagepool import SandboxSchemes, sandboxPool
+from pyhtmleditor.saver import writeAtomic
+from pyhtmleditor.stats import percentile
+
+# pages loading files at the same time in one worker process
+PagesPerWorker = 4
+
+# files handed to a worker process at once
+ChunkSize = 16
+
+# milliseconds a file may take before it fails
+FileTimeout = 60000
+
+HtmlExtensions = (".htm", ".html")
+
+NormalizeSource = """
+(function() {
+    var links = %(links)s;
+    if (document.body) {
+        document.designMode = "on";
+        window.getSelection().selectAllChildren(document.body);
+        %(commands)s
+        window.getSelection().removeAllRanges();
+        document.designMode = "off";
+    }
+    var attributes = [["a", "href"], ["img", "src"], ["link", "href"], ["script", "src"]];
+    for (var k = 0; k < attributes.length && links.length; k++) {
+        var tag = attributes[k][0], attr = attributes[k][1];
+        var elements = document.querySelectorAll(tag + "[" + attr + "]");
+        for (var i = 0; i < elements.length; i++) {
+            var value = elements[i].getAttribute(attr);
+            for (var j = 0; j < links.length; j++) {
+                if (value.indexOf(links[j][0]) === 0) {
+                    elements[i].setAttribute(attr, links[j][1] + value.substring(links[j][0].length));
+                    break;
+                }
+            }
+        }
+    }
+    var images = [];
+    if (%(inline)s) {
+        for (var i = 0; i < document.images.length; i++)
+            images.push(document.images[i].src);
+    }
+    return JSON.stringify(images);
+})();
+"""
+
+InlineSource = """
+(function(sources) {
+    for (var i = 0; i < sources.length && i < document.images.length; i++) {
+        if (sources[i]) {
+            document.images[i].setAttribute("src", sources[i]);
+            document.images[i].removeAttribute("srcset");
+        }
+    }
+    return true;
+})(%s);
+"""
+
+
+def collectFiles(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, dirs, names in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(directory, name) for name in sorted(names)
+                        if name.lower().endswith(HtmlExtensions))
+        else:
+            files.append(path)
+    return [os.path.abspath(f) for f in files]
+
+
+def parsePairs(values, separator="="):
+    pairs = []
+    for value in values or []:
+        name, sep, arg = value.partition(separator)
+        pairs.append((name, arg if sep else None))
+    return pairs
+
+
+def normalizeScript(options):
+    calls = "".join(jsruntime.execCall(cmd, arg) for cmd, arg in options["commands"])
+    return NormalizeSource % {"commands": calls,
+                        "links": json.dumps(options["links"]),
+                        "inline": json.dumps(options["inlineImages"])}
+
+
+def dataUrl(fileName, mimeDatabase):
+    with open(fileName, "rb") as fd:
+        data = base64.b64encode(fd.read()).decode("ascii")
+    return "data:{0};base64,{1}".format(mimeDatabase.mimeTypeForFile(fileName).name(), data)
+
+
+def outputPath(fileName, options):
+    if not options["output"]:
+        return fileName
+    return os.path.join(options["output"], os.path.relpath(fileName, options["root"]))
+
+
+def workerPool(pages, parent=None):
+    """
+    Return the pool of pages a worker loads its files into
+
+    The files are untrusted, their scripts do not run and they request
+    nothing but their own local files and inline data. The normalization
+    runs in the runtime's world.
+    """
+    return sandboxPool(pages, parent, SandboxSchemes + (schemehandler.Scheme.decode(),),
+            minPages=pages)
+
+
+class BatchJob(object):
+
+    def __init__(self, fileName, page):
+        self.fileName = fileName
+        self.page = page
+        self.started = time.perf_counter()
+        self.timer = None
+        self.loadSlot = None
+        self.done = False
+
+
+class BatchRunner(QtCore.QObject):
+    """
+    Normalize files with pages taken from a PagePool
+
+    run() loads the queued files into the pages of the pool and returns
+    the list of (fileName, seconds, error) once all of them are written,
+    error being an empty string on success. A file fails when it takes
+    longer than the "timeout" option or its renderer process dies.
+    """
+
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, options, pool, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.options = options
+        self.script = normalizeScript(options)
+        self.timeout = options.get("timeout", FileTimeout)
+        self.mimeDatabase = QtCore.QMimeDatabase()
+        self.pool = pool
+        # page to the job loaded into it
+        self.jobs = {}
+        self.watched = weakref.WeakSet()
+        self.queue = collections.deque()
+        self.results = []
+
+    def run(self, files):
+        self.queue.extend(files)
+        self.results = []
+        loop = QtCore.QEventLoop()
+        self.finished.connect(loop.quit)
+        for i in range(min(len(self.queue), self.pool.maxPages)):
+            self.pool.acquire(self.start)
+        if self.jobs or self.queue:
+            loop.exec_()
+        self.finished.disconnect(loop.quit)
+        return self.results
+
+    def start(self, page):
+        if not self.queue:
+            self.pool.release(page)
+            return
+        job = BatchJob(self.queue.popleft(), page)
+        self.jobs[page] = job
+        job.timer = QtCore.QTimer(self)
+        job.timer.setSingleShot(True)
+        job.timer.timeout.connect(lambda: self.done(job, "timed out"))
+        job.timer.start(self.timeout)
+        if page not in self.watched:
+            # pages stay in the pool, connected once for all their jobs
+            self.watched.add(page)
+            page.renderProcessTerminated.connect(
+                    lambda status, code, page=page: self.terminated(page))
+        self.pool.schemeHandler.allow(os.path.dirname(job.fileName))
+        job.loadSlot = lambda ok: self.loaded(job, ok)
+        page.loadFinished.connect(job.loadSlot)
+        page.load(schemehandler.urlForFile(job.fileName, document=True))
+
+    def terminated(self, page):
+        job = self.jobs.get(page)
+        if job is not None:
+            self.done(job, "renderer process terminated")
+
+    def done(self, job, error=""):
+        # late callbacks of the job find it done and leave the page alone
+        if job.done:
+            return
+        job.done = True
+        job.timer.stop()
+        job.timer.deleteLater()
+        job.page.loadFinished.disconnect(job.loadSlot)
+        del self.jobs[job.page]
+        self.results.append((job.fileName, time.perf_counter() - job.started, error))
+        self.pool.release(job.page)
+        job.page = None
+        if self.queue:
+            self.pool.acquire(self.start)
+        elif not self.jobs:
+            self.finished.emit()
+
+    def loaded(self, job, ok):
+        if job.done:
+            return
+        if not ok:
+            self.done(job, "load failed")
+            return
+        job.page.runJavaScript(self.script, jsruntime.WorldId,
+                lambda images: self.normalized(job, images))
+
+    def normalized(self, job, images):
+        if job.done:
+            return
+        images = json.loads(images) if images else []
+        if not images:
+            job.page.toHtml(lambda html: self.serialized(job, html))
+            return
+        sources = []
+        for src in images:
+            url = QtCore.QUrl(src)
+            path = schemehandler.fileForUrl(url) if url.scheme() == schemehandler.Scheme.decode() else None
+            try:
+                sources.append(dataUrl(path, self.mimeDatabase) if path else None)
+            except (IOError, OSError):
+                sources.append(None)
+        job.page.runJavaScript(InlineSource % json.dumps(sources), jsruntime.WorldId,
+                lambda result: self.inlined(job))
+
+    def inlined(self, job):
+        if not job.done:
+            job.page.toHtml(lambda html: self.serialized(job, html))
+
+    def serialized(self, job, html):
+        if job.done:
+            return
+        target = outputPath(job.fileName, self.options)
+        try:
+            directory = os.path.dirname(target)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            writeAtomic(target, html.encode("utf-8"))
+        except (OSError, UnicodeError) as e:
+            self.done(job, str(e))
+        else:
+            self.done(job)
+
+
+# the runner of a worker process, kept between chunks
+_runner = None
+
+
+def initWorker(options, pages):
+    global _runner
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    schemehandler.registerScheme()
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication(sys.argv[:1])
+    # pages stay warm between chunks
+    pool = workerPool(pages, app)
+    pool.warm()
+    _runner = BatchRunner(options, pool, app)
+
+
+def processChunk(files):
+    return _runner.run(files)
+
+
+def report(results, seconds):
+    failed = [(f, error) for f, s, error in results if error]
+    for fileName, error in failed:
+        print("%s: %s" % (fileName, error))
+    timings = [s for f, s, error in results]
+    print("%d files, %d failed in %.2fs, %.1f files/s" % (
+            len(results), len(failed), seconds, len(results) / seconds if seconds else 0.0))
+    if timings:
+        print("latency p50 %.1fms  p90 %.1fms  p99 %.1fms  max %.1fms" % (
+                percentile(timings, 0.50) * 1e3, percentile(timings, 0.90) * 1e3,
+                percentile(timings, 0.99) * 1e3, max(timings) * 1e3))
+    return len(failed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pyhtmleditor --batch",
+            description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="HTML files or directories")
+    parser.add_argument("--output", metavar="DIR",
+            help="write the results below DIR instead of in place")
+    parser.add_argument("--exec", dest="commands", action="append", metavar="CMD[=ARG]",
+            help="editing command applied to the whole body, may be repeated")
+    parser.add_argument("--rewrite-links", dest="links", action="append", metavar="FROM=TO",
+            help="replace the URL prefix FROM by TO, may be repeated")
+    parser.add_argument("--inline-images", action="store_true",
+            help="embed local images as data: URLs")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+            help="worker processes")
+    parser.add_argument("--pages", type=int, default=PagesPerWorker,
+            help="pages per worker process")
+    parser.add_argument("--timeout", type=int, default=FileTimeout,
+            help="milliseconds per file")
+    args = parser.parse_args(argv)
+
+    files = collectFiles(args.paths)
+    if not files:
+        parser.error("no HTML files found")
+    links = parsePairs(args.links)
+    for prefix, replacement in links:
+        if replacement is None:
+            parser.error("--rewrite-links expects FROM=TO: %s" % prefix)
+    options = {
+        "output": os.path.abspath(args.output) if args.output else None,
+        "root": os.path.commonpath([os.path.dirname(f) for f in files]),
+        "commands": parsePairs(args.commands),
+        "links": links,
+        "inlineImages": args.inline_images,
+        "timeout": args.timeout,
+    }
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    workers = max(1, min(args.workers, len(files)))
+    chunks = [files[i:i + ChunkSize] for i in range(0, len(files), ChunkSize)]
+    start = time.perf_counter()
+    results = []
+    if workers == 1:
+        initWorker(options, args.pages)
+        for chunk in chunks:
+            results.extend(processChunk(chunk))
+    else:
+        # a forked Qt process is not safe to use, start fresh interpreters
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(workers, initWorker, (options, args.pages)) as pool:
+            for chunkResults in pool.imap_unordered(processChunk, chunks):
+                results.extend(chunkResults)
+    if report(results, time.perf_counter() - start):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
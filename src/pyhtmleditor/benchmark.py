@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Micro-benchmarks for the tokenizer and the source highlighter
+
+Run headless with e.g.:
+
+    python -m pyhtmleditor.benchmark --sizes 10k,1m --save baseline.json
+    python -m pyhtmleditor.benchmark --sizes 10k,1m --compare baseline.json
+    python -m pyhtmleditor.benchmark --round-trips 1000
+
+The highlighter runs on the offscreen Qt platform. Without PyQt5 only
+the tokenizer is measured. --round-trips counts the JavaScript round
+trips the editor makes per selection change instead.
+
+benchmarks/baseline.json in the source tree holds tokenizer results for
+all sizes, to compare with --compare. Timings depend on the machine,
+save a baseline of your own before comparing a change.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from pyhtmleditor.htmltokenizer import scan, State_Text
+from pyhtmleditor.stats import percentile
+
+Sizes = {"10k": 10 * 1024, "1m": 1024 * 1024, "20m": 20 * 1024 * 1024}
+
+# slowdown of blocks per second, relative to the baseline, reported as
+# a regression
+Tolerance = 0.2
+
+# the Qt application of a run, it has to outlive the benchmarks
+_application = None
+
+Example = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ui", "example.html")
+
+
+def _repeat(unit, size, separator="\n"):
+    count = max(1, size // (len(unit) + len(separator)))
+    return separator.join([unit] * count)
+
+
+def nested(size):
+    depth = 32
+    unit = "".join("<div class=\"d%d\">" % i for i in range(depth)) + "text" + "</div>" * depth
+    return _repeat(unit, size)
+
+
+def attributes(size):
+    unit = "<input " + " ".join("data-a%d='v%d' b%d=\"x y\" c%d=z%d" % (i, i, i, i, i)
+            for i in range(8)) + " disabled>"
+    return _repeat(unit, size)
+
+
+def comments(size):
+    lines = _repeat("comment text -- with <tags> & stuff", size - 8)
+    return "<!--\n" + lines + "\n-->"
+
+
+def minified(size):
+    unit = "<li class=\"item\"><a href=\"/x?a=1&amp;b=2\">link</a></li>"
+    return _repeat(unit, size, separator="")
+
+
+def entities(size):
+    unit = "&amp; &lt;tag&gt; &#169; &#x1F600; &nbsp;&foo; & && &#; &#x; &amp"
+    return _repeat(unit, size)
+
+
+def pathological(size):
+    # very long lines of '&', unterminated references and quotes, and
+    # of CSS words no ':' follows
+    fifth = size // 5
+    return "\n".join(["&" * fifth, "&#x" + "f" * fifth, "<a b=\"" + "&a" * (fifth // 2),
+                      "<style>a{" + "a" * fifth, "<style>a{" + "-" * fifth])
+
+
+def embedded(size):
+    unit = ("<style>body { margin: 0 10px; color: #fff } /* c */</style>\n"
+            "<script>var x = 'a' + \"b\"; /* block */ if (x) { return 0x1f; } // end\n"
+            "let t = `tmpl ${x}`;</script>")
+    return _repeat(unit, size)
+
+
+def realWorld(size):
+    with open(Example) as fd:
+        unit = fd.read()
+    return _repeat(unit, size)
+
+
+Corpora = [
+    ("nested", nested),
+    ("attributes", attributes),
+    ("comments", comments),
+    ("minified", minified),
+    ("entities", entities),
+    ("pathological", pathological),
+    ("embedded", embedded),
+    ("example", realWorld),
+]
+
+
+def summarize(timings):
+    total = sum(timings)
+    return {
+        "blocks": len(timings),
+        "seconds": total,
+        "blocks_per_second": len(timings) / total if total else 0.0,
+        "p50_us": percentile(timings, 0.50) * 1e6,
+        "p90_us": percentile(timings, 0.90) * 1e6,
+        "p99_us": percentile(timings, 0.99) * 1e6,
+        "max_us": max(timings) * 1e6 if timings else 0.0,
+    }
+
+
+def benchTokenizer(text):
+    timings = []
+    clock = time.perf_counter
+    state = State_Text
+    for line in text.split("\n"):
+        start = clock()
+        state = scan(line, state)[1]
+        timings.append(clock() - start)
+    return summarize(timings)
+
+
+def benchHighlighter(text):
+    from PyQt5 import QtGui
+    from pyhtmleditor.highlighter import Highlighter
+
+    class TimedHighlighter(Highlighter):
+        def highlightBlock(self, text):
+            start = time.perf_counter()
+            Highlighter.highlightBlock(self, text)
+            self.timings.append(time.perf_counter() - start)
+
+    document = QtGui.QTextDocument()
+    highlighter = TimedHighlighter(document)
+    highlighter.setCacheSize(0)
+    highlighter.timings = []
+    document.setPlainText(text)
+    result = summarize(highlighter.timings)
+    highlighter.setDocument(None)
+    return result
+
+
+def benchRoundTrips(count):
+    """
+    Fire count selection changes at an editor, return the round trips
+    per change with a toolbar refresh after every change and for the
+    whole burst coalesced by the throttle
+    """
+    from PyQt5.QtWidgets import QApplication
+    from pyhtmleditor.htmleditor import HtmlEditor
+
+    editor = HtmlEditor()
+    page = editor.webView.page()
+    results = {}
+    for mode in ("refresh", "burst"):
+        editor.jsRoundTrips = 0
+        for i in range(count):
+            page.selectionChanged.emit()
+            if mode == "refresh":
+                editor.selectionThrottle.flush()
+        editor.selectionThrottle.flush()
+        QApplication.processEvents()
+        results[mode] = editor.jsRoundTrips / count
+    # nothing was edited, close without asking
+    editor.setWindowModified(False)
+    editor.close()
+    return results
+
+
+def application(cls):
+    global _application
+    _application = cls.instance() or cls(sys.argv[:1])
+    return _application
+
+
+def run(sizes, names=None, highlighter=True):
+    results = {}
+    for name, generate in Corpora:
+        if names and name not in names:
+            continue
+        for size in sizes:
+            text = generate(Sizes[size])
+            key = "%s/%s" % (name, size)
+            results["tokenizer/" + key] = benchTokenizer(text)
+            report("tokenizer/" + key, results["tokenizer/" + key])
+            if highlighter:
+                results["highlighter/" + key] = benchHighlighter(text)
+                report("highlighter/" + key, results["highlighter/" + key])
+    return results
+
+
+def report(key, result):
+    print("%-36s %9d blocks %12.0f blocks/s  p50 %8.1fus  p90 %8.1fus  p99 %8.1fus  max %10.1fus" % (
+            key, result["blocks"], result["blocks_per_second"],
+            result["p50_us"], result["p90_us"], result["p99_us"], result["max_us"]))
+
+
+def compare(results, baseline):
+    """Print the change against baseline, returns the number of regressions"""
+    regressions = 0
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        old = baseline[key]["blocks_per_second"]
+        new = results[key]["blocks_per_second"]
+        if not old:
+            continue
+        change = (new - old) / old
+        mark = ""
+        if change < -Tolerance:
+            mark = "  REGRESSION"
+            regressions += 1
+        print("%-36s %12.0f -> %12.0f blocks/s  %+6.1f%%%s" % (key, old, new, change * 100, mark))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10k,1m,20m",
+            help="comma separated sizes out of %s" % ", ".join(sorted(Sizes)))
+    parser.add_argument("--corpus", action="append",
+            help="only run this corpus, may be repeated")
+    parser.add_argument("--tokenizer-only", action="store_true",
+            help="do not benchmark the Qt highlighter")
+    parser.add_argument("--save", metavar="FILE", help="store the results as a baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results with a baseline")
+    parser.add_argument("--round-trips", type=int, metavar="N",
+            help="count JavaScript round trips over N selection changes")
+    args = parser.parse_args(argv)
+
+    if args.round_trips:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        from PyQt5.QtWidgets import QApplication
+        # imported for its side effect, WebEngine has to be loaded and
+        # the editor's scheme registered before the application exists
+        from PyQt5 import QtWebEngineWidgets  # noqa: F401
+        from pyhtmleditor import schemehandler
+        schemehandler.registerScheme()
+        application(QApplication)
+        for mode, trips in sorted(benchRoundTrips(args.round_trips).items()):
+            print("%-10s %8.3f round trips per selection change" % (mode, trips))
+        return 0
+
+    sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    for size in sizes:
+        if size not in Sizes:
+            parser.error("unknown size: %s" % size)
+
+    highlighter = not args.tokenizer_only
+    if highlighter:
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        try:
+            from PyQt5.QtGui import QGuiApplication
+        except ImportError:
+            print("PyQt5 not available, benchmarking the tokenizer only")
+            highlighter = False
+        else:
+            application(QGuiApplication)
+
+    results = run(sizes, args.corpus, highlighter)
+
+    if args.save:
+        with open(args.save, "w") as fd:
+            json.dump(results, fd, indent=1, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+        if compare(results, baseline):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,215 +14,420 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from PyQt5 import QtGui
-
-DocType = 0
-Entity = 1
-Tag = 2
-Comment = 3
-AttributeName = 4
-AttributeValue = 5
-
-State_Text = -1
-State_DocType = 0
-State_Comment = 1
-State_TagStart = 2
-State_TagName = 3
-State_InsideTag = 4
-State_AttributeName =5
-State_SingleQuote = 6
-State_DoubleQuote = 7
-State_AttributeValue = 8
+import time
+import weakref
+from collections import OrderedDict
+
+from PyQt5 import QtCore, QtGui
+
+from pyhtmleditor.htmltokenizer import (scan,
+        DocType, Entity, Tag, Comment, AttributeName, AttributeValue,
+        Keyword, String, Number, Property, Selector,
+        State_Text, State_DocType, State_Comment, State_TagStart,
+        State_TagName, State_InsideTag, State_AttributeName,
+        State_SingleQuote, State_DoubleQuote, State_AttributeValue,
+        State_Embedded)
+
+# lazy mode: block not highlighted yet
+State_Pending = -2
+
+# lazy mode: blocks highlighted beyond the viewport, and per idle slice
+LazyMargin = 100
+LazySlice = 200
+
+# token kind to (r, g, b) color
+ColorSchemes = {
+    "default": {
+        DocType: (192, 192, 192),
+        Entity: (128, 128, 128),
+        Tag: (136, 18, 128),
+        Comment: (35, 110, 37),
+        AttributeName: (153, 69, 0),
+        AttributeValue: (36, 36, 170),
+        Keyword: (170, 13, 145),
+        String: (196, 26, 22),
+        Number: (28, 0, 207),
+        Property: (153, 69, 0),
+        Selector: (136, 18, 128),
+    },
+    "dark": {
+        DocType: (128, 128, 128),
+        Entity: (180, 180, 180),
+        Tag: (93, 176, 215),
+        Comment: (106, 153, 85),
+        AttributeName: (156, 220, 254),
+        AttributeValue: (206, 145, 120),
+        Keyword: (197, 134, 192),
+        String: (206, 145, 120),
+        Number: (181, 206, 168),
+        Property: (156, 220, 254),
+        Selector: (215, 186, 125),
+    },
+}
+
+def createFormats(scheme):
+    # tuple indexed by token kind, it is never modified
+    formats = []
+    for kind in range(len(scheme)):
+        fmt = QtGui.QTextCharFormat()
+        fmt.setForeground(QtGui.QColor(*scheme[kind]))
+        formats.append(fmt)
+    return tuple(formats)
+
+# scan results remembered per highlighter
+CacheSize = 4096
+
+# background mode: characters inserted at once that start a scan of the
+# whole document on a worker thread, and lines per delivered chunk
+BackgroundThreshold = 256 * 1024
+BackgroundChunk = 2000
+
+# background mode: lines scanned before the worker sleeps for a moment, so
+# it does not hold the GIL against the GUI thread for long
+BackgroundYield = 100
+BackgroundSleep = 0.001
+
+class SegmentData(QtGui.QTextBlockUserData):
+    """Marks a block whose line goes on in the next block"""
+
+def markContinued(block, continued):
+    if continued:
+        block.setUserData(SegmentData())
+    elif block.userData() is not None:
+        block.setUserData(None)
+
+def isContinued(block):
+    return isinstance(block.userData(), SegmentData)
+
+def replaceLines(document, start, end, segments):
+    """
+    Replace the blocks start to end of document with segments
+
+    :param document: The QTextDocument of the source view
+    :param start: Number of the first block replaced
+    :param end: Number of the block after the last one replaced
+    :param segments: (line, continued) tuples as made by
+        sourcetext.splitSegments
+    """
+    lines = [line for line, continued in segments]
+    cursor = QtGui.QTextCursor(document)
+    # the document reports the change at the end of the edit block,
+    # so the blocks are marked before they are highlighted
+    cursor.beginEditBlock()
+    if start < end:
+        first = document.findBlockByNumber(start)
+        last = document.findBlockByNumber(end - 1)
+        cursor.setPosition(first.position())
+        cursor.setPosition(last.position() + last.length() - 1, QtGui.QTextCursor.KeepAnchor)
+        if lines:
+            cursor.insertText("\n".join(lines))
+        else:
+            # drop the line separator as well
+            if end < document.blockCount():
+                cursor.setPosition(document.findBlockByNumber(end).position(), QtGui.QTextCursor.KeepAnchor)
+            elif start > 0:
+                previous = document.findBlockByNumber(start - 1)
+                cursor.setPosition(cursor.position())
+                cursor.setPosition(previous.position() + previous.length() - 1, QtGui.QTextCursor.KeepAnchor)
+            cursor.removeSelectedText()
+    elif start < document.blockCount():
+        cursor.setPosition(document.findBlockByNumber(start).position())
+        cursor.insertText("\n".join(lines) + "\n")
+    else:
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.insertText("\n" + "\n".join(lines))
+    block = document.findBlockByNumber(start)
+    for line, continued in segments:
+        markContinued(block, continued)
+        block = block.next()
+    cursor.endEditBlock()
+
+class ScanThread(QtCore.QThread):
+    """
+    Scan a whole text line by line off the GUI thread
+
+    Results are delivered in chunks as a dict mapping (state, line, True)
+    to (spans, end state), the same shape Highlighter.scanBlock uses.
+    Blocks continuing their line are not known here, they miss the
+    results and are scanned by the highlighter itself.
+
+    The thread sleeps every BackgroundYield lines, scanning is pure
+    Python and would otherwise keep the GUI thread waiting for the GIL.
+    """
+
+    chunkReady = QtCore.pyqtSignal(int, object, bool)
+
+    def __init__(self, text, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.text = text
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def stop(self):
+        # also connected to the owner's destroyed signal and aboutToQuit,
+        # a QThread must not be destroyed while it is running
+        self.cancel()
+        self.wait()
+
+    def run(self):
+        state = State_Text
+        results = {}
+        count = 0
+        for line in self.text.split("\n"):
+            if self.cancelled:
+                return
+            spans, end = scan(line, state)
+            results[(state, line, True)] = (tuple(spans), end)
+            state = end
+            count += 1
+            if count % BackgroundYield == 0:
+                time.sleep(BackgroundSleep)
+            if count % BackgroundChunk == 0:
+                self.chunkReady.emit(count, results, False)
+                results = {}
+        self.chunkReady.emit(count, results, True)
 
 class Highlighter(QtGui.QSyntaxHighlighter):
 
+    # token kind to QTextCharFormat, shared by all highlighters
+    formats = None
+    colorScheme = "default"
+    instances = weakref.WeakSet()
+
+    @classmethod
+    def setColorScheme(cls, name):
+        """
+        Switch all highlighters to the color scheme name
+
+        The shared format table is replaced at once and every live
+        highlighter rehighlights its document once.
+
+        :param name: A key of ColorSchemes
+        """
+        cls.formats = createFormats(ColorSchemes[name])
+        cls.colorScheme = name
+        for highlighter in list(cls.instances):
+            highlighter.rehighlight()
+
     def __init__(self, parent=None):
         QtGui.QSyntaxHighlighter.__init__(self, parent)
-        self.m_colors = {}
-        self.m_colors[DocType] = QtGui.QColor(192, 192, 192)
-        self.m_colors[Entity] = QtGui.QColor(128, 128, 128)
-        self.m_colors[Tag] = QtGui.QColor(136, 18, 128)
-        self.m_colors[Comment] = QtGui.QColor(35, 110, 37)
-        self.m_colors[AttributeName] = QtGui.QColor(153, 69, 0)
-        self.m_colors[AttributeValue] = QtGui.QColor(36, 36, 170)
+        if Highlighter.formats is None:
+            Highlighter.formats = createFormats(ColorSchemes[Highlighter.colorScheme])
+        Highlighter.instances.add(self)
+
+        self.cache = OrderedDict()
+        self.cacheSize = CacheSize
+        self.cacheHits = 0
+        self.cacheMisses = 0
+
+        self.background = False
+        self.scanThread = None
+        self.scannedLines = 0
+        self.precomputed = {}
+
+        self.lazyView = None
+        self.lazyLimit = -1
+        self.lazyFrontier = 0
+        self.idleTimer = QtCore.QTimer(self)
+        self.idleTimer.setInterval(0)
+        self.idleTimer.timeout.connect(self.highlightIdleSlice)
+
+    def setCacheSize(self, size):
+        self.cacheSize = size
+        while len(self.cache) > size:
+            self.cache.popitem(last=False)
+
+    def cacheHitRate(self):
+        lookups = self.cacheHits + self.cacheMisses
+        return float(self.cacheHits) / lookups if lookups else 0.0
+
+    def scanBlock(self, text, state, lineEnd=True):
+        """
+        Scan one block, replaying the result of an earlier scan if the
+        same text was already scanned from the same previous state
+
+        lineEnd is False for a block continuing its line in the next one.
+        """
+        key = (state, text, lineEnd)
+        if self.precomputed:
+            result = self.precomputed.get(key)
+            if result is not None:
+                return result
+        result = self.cache.get(key)
+        if result is not None:
+            self.cacheHits += 1
+            self.cache.move_to_end(key)
+            return result
+        self.cacheMisses += 1
+        spans, state = scan(text, state, lineEnd)
+        result = (tuple(spans), state)
+        if self.cacheSize > 0:
+            self.cache[key] = result
+            if len(self.cache) > self.cacheSize:
+                self.cache.popitem(last=False)
+        return result
+
+    def setLazy(self, view):
+        """
+        Highlight only the visible blocks of view, plus a margin, at once
+
+        The remaining blocks are marked State_Pending and highlighted in
+        idle time slices. Blocks are always highlighted in order, so the
+        block state chain stays exact. Pass None to highlight eagerly.
+
+        :param view: The QPlainTextEdit showing the document
+        """
+        if self.lazyView is not None:
+            self.lazyView.updateRequest.disconnect(self.ensureVisibleHighlighted)
+            self.document().contentsChange.disconnect(self.lazyContentsChange)
+        wasLazy = self.lazyView is not None
+        frontier = self.lazyFrontier
+        self.lazyView = view
+        self.lazyLimit = -1
+        self.lazyFrontier = 0
+        if view is not None:
+            view.updateRequest.connect(self.ensureVisibleHighlighted)
+            # connected ahead of the highlighter's own slot, so the limit
+            # is lowered before the changed blocks are highlighted
+            document = self.document()
+            self.setDocument(None)
+            document.contentsChange.connect(self.lazyContentsChange)
+            self.resetLazyLimit()
+            self.setDocument(document)
+            self.ensureVisibleHighlighted()
+        else:
+            self.idleTimer.stop()
+            if wasLazy:
+                # the blocks before the frontier are up to date already,
+                # highlighting continues from the first pending one
+                block = self.document().findBlockByNumber(frontier)
+                while block.isValid() and block.userState() != State_Pending:
+                    block = block.next()
+                if block.isValid():
+                    self.rehighlightBlock(block)
+            else:
+                self.rehighlight()
+
+    def setBackground(self, enabled):
+        """
+        Scan large insertions on a worker thread, works in lazy mode only
+
+        The GUI thread then just applies the precomputed spans to the
+        pending blocks, a slice per event loop iteration.
+        """
+        self.background = enabled
+        if not enabled:
+            self.stopBackgroundScan()
+
+    def startBackgroundScan(self):
+        self.stopBackgroundScan()
+        self.scannedLines = 0
+        self.scanThread = ScanThread(self.document().toPlainText(), self)
+        self.scanThread.chunkReady.connect(self.backgroundChunk)
+        self.scanThread.finished.connect(self.scanThread.deleteLater)
+        # the thread is a child of the highlighter, destroyed is emitted
+        # before the children are deleted
+        self.destroyed.connect(self.scanThread.stop)
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.scanThread.stop)
+        self.scanThread.start(QtCore.QThread.LowPriority)
+
+    def stopBackgroundScan(self):
+        if self.scanThread is not None:
+            self.scanThread.chunkReady.disconnect(self.backgroundChunk)
+            self.scanThread.stop()
+            self.scanThread = None
+        self.precomputed = {}
+
+    def backgroundChunk(self, count, results, done):
+        self.precomputed.update(results)
+        self.scannedLines = count
+        if done:
+            self.scanThread = None
+        if not self.idleTimer.isActive():
+            self.idleTimer.start()
+
+    def lazyContentsChange(self, position, removed, added):
+        # removed lines shift pending blocks in front of the frontier
+        number = self.document().findBlock(position).blockNumber()
+        self.lazyFrontier = max(0, min(self.lazyFrontier, number))
+        last = self.document().findBlock(position + added).blockNumber()
+        if last - number >= LazySlice:
+            # the limit reached on an earlier text is no reason to
+            # highlight this much of the new one at once
+            self.resetLazyLimit()
+        if self.background and added >= BackgroundThreshold:
+            self.startBackgroundScan()
+
+    def resetLazyLimit(self):
+        self.lazyLimit = self.lastVisibleBlock() + LazyMargin
+
+    def rehighlight(self):
+        # in lazy mode only the visible part is due now, the rest
+        # follows in idle time
+        if self.lazyView is not None:
+            self.resetLazyLimit()
+        QtGui.QSyntaxHighlighter.rehighlight(self)
+
+    def lastVisibleBlock(self):
+        viewport = self.lazyView.viewport()
+        cursor = self.lazyView.cursorForPosition(QtCore.QPoint(0, viewport.height() - 1))
+        return max(0, cursor.blockNumber())
+
+    def ensureVisibleHighlighted(self, *args):
+        if self.lazyView is None:
+            return
+        limit = self.lastVisibleBlock() + LazyMargin
+        if limit > self.lazyLimit:
+            self.highlightUpTo(limit)
+
+    def highlightIdleSlice(self):
+        limit = self.lazyLimit + LazySlice
+        if self.scanThread is not None:
+            # only apply what the worker has scanned, the next chunk
+            # restarts the timer
+            if self.lazyFrontier >= self.scannedLines:
+                self.idleTimer.stop()
+                return
+            limit = min(limit, self.scannedLines - 1)
+        if not self.highlightUpTo(limit):
+            self.idleTimer.stop()
+            if self.scanThread is None:
+                self.precomputed = {}
+
+    def highlightUpTo(self, limit):
+        # returns False when no pending block is left
+        self.lazyLimit = max(self.lazyLimit, limit)
+        block = self.document().findBlockByNumber(self.lazyFrontier)
+        while block.isValid() and block.userState() != State_Pending:
+            block = block.next()
+        if not block.isValid():
+            self.lazyFrontier = self.document().blockCount()
+            return False
+        self.lazyFrontier = block.blockNumber()
+        if self.lazyFrontier > self.lazyLimit:
+            self.lazyLimit = self.lazyFrontier + LazySlice
+        self.rehighlightBlock(block)
+        return True
 
     def highlightBlock(self, text):
         state = int(self.previousBlockState())
-        length = len(text)
-        start = 0
-        pos = 0
-
-        while (pos < length):
-
-            if state == State_Text:
-                while (pos < length):
-                    ch = text[pos]
-                    if ch == '<':
-                        if text[pos:pos+4] == "<!--":
-                            state = State_Comment
-                        else:
-                            if text[pos:pos+9].upper() == "<!DOCTYPE":
-                                state = State_DocType
-                            else:
-                                state = State_TagStart
-                        break
-                    elif ch == "&":
-                        start = pos
-                        while pos < length:
-                            if text[pos + 1] != ";":
-                                self.setFormat(start, pos - start, self.m_colors[Entity])
-                    else:
-                        pos += 1
-
-            elif state == State_Comment:
-                start = pos
-                while pos < length:
-                    if text[pos:pos+3] == "-->":
-                        pos += 3
-                        state = State_Text
-                        break
-                    else:
-                        pos += 1
-                self.setFormat(start, pos - start, self.m_colors[Comment])
-
-            elif state == State_DocType:
-                start = pos
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == ">":
-                        state = State_Text
-                        break
-                self.setFormat(start, pos - start, self.m_colors[DocType])
-
-            # at '<' in e.g. "<span>foo</span>"
-            elif state == State_TagStart:
-                start = pos + 1
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == ">":
-                        state = State_Text
-                        break
-                    if ch != ' ':
-                        pos -= 1
-                        state = State_TagName
-                        break
-
-            # at 'b' in e.g "<blockquote>foo</blockquote>"
-            elif state == State_TagName:
-                start = pos
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == ' ':
-                        pos -= 1
-                        state = State_InsideTag
-                        break
-                    if ch == ">":
-                        state = State_Text
-                        break
-                self.setFormat(start, pos - start, self.m_colors[Tag])
-
-            # anywhere after tag name and before tag closing ('>')
-            elif state == State_InsideTag:
-                start = pos
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == "/":
-                        continue
-                    if ch == ">":
-                        state = State_Text
-                        break
-                    if ch != ' ':
-                        pos -= 1
-                        state = State_AttributeName
-                        break
-
-            # at 's' in e.g. <img src=bla.png/>
-            elif state == State_AttributeName:
-                start = pos
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == "=":
-                        state = State_AttributeValue
-                        break
-                    if ch == ">" or ch == "/":
-                        state = State_InsideTag
-                        break
-                self.setFormat(start, pos - start, self.m_colors[AttributeName])
-
-            # after '=' in e.g. <img src=bla.png/>
-            elif state ==State_AttributeValue:
-                # find first non-space character
-                start = pos
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == "'":
-                        state = State_SingleQuote
-                        break
-                    if ch == '"':
-                        state = State_DoubleQuote
-                        break
-                    if ch != ' ':
-                        break
-
-                if state == State_AttributeValue:
-                    # attribute value without quote
-                    # just stop at non-space or tag delimiter
-                    start = pos
-                    while pos < length:
-                        ch = text[pos]
-                        if ch == ' ':
-                            break
-                        if ch == ">" or ch == "/":
-                            break
-                        pos += 1
-                    state = State_InsideTag
-                    self.setFormat(start, pos - start, self.m_colors[AttributeValue])
-
-            # after the opening single quote in an attribute value
-            elif state == State_SingleQuote:
-                start = pos
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == "'":
-                        break
-                state = State_InsideTag
-                self.setFormat(start, pos - start, self.m_colors[AttributeValue])
-
-            # after the opening double quote in an attribute value
-            elif state == State_DoubleQuote:
-                start = pos
-                while pos < length:
-                    ch = text[pos]
-                    pos += 1
-                    if ch == '"':
-                        break
-                state = State_InsideTag
-                self.setFormat(start, pos - start, self.m_colors[AttributeValue])
-            else:
-                while (pos < length):
-                    ch = text[pos]
-                    if ch == '<':
-                        if text[pos:pos+4] == "<!--":
-                            state = State_Comment
-                        else:
-                            if text[pos:pos+9].toUpper() == "<!DOCTYPE":
-                                state = State_DocType
-                            else:
-                                state = State_TagStart
-                        break
-                    elif ch == "&":
-                        start = pos
-                        while pos < length:
-                            if text[pos + 1] != ";":
-                                self.setFormat(start, pos - start, self.m_colors[Entity])
-                    else:
-                        pos += 1
 
+        if self.lazyView is not None:
+            number = self.currentBlock().blockNumber()
+            if state == State_Pending or number > self.lazyLimit:
+                self.setCurrentBlockState(State_Pending)
+                self.lazyFrontier = min(self.lazyFrontier, number)
+                if not self.idleTimer.isActive():
+                    self.idleTimer.start()
+                return
+
+        lineEnd = not isContinued(self.currentBlock())
+        spans, state = self.scanBlock(text, state, lineEnd)
+        formats = Highlighter.formats
+        for start, length, kind, _ in spans:
+            self.setFormat(start, length, formats[kind])
         self.setCurrentBlockState(state)
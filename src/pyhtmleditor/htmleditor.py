@@ -16,13 +16,20 @@
 
 import os
 import sys
+import html
+import json
+import collections
 
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5 import QtCore, QtWebEngineWidgets, QtWidgets, QtWebChannel
 
-from pyhtmleditor.highlighter import Highlighter
+from pyhtmleditor import assets, imagepipeline, jsruntime, schemehandler, sourcetext
+from pyhtmleditor.highlighter import Highlighter, replaceLines
+from pyhtmleditor.journal import Autosaver
+from pyhtmleditor.saver import DocumentSaver
+from pyhtmleditor.throttle import Throttle
 from pyhtmleditor.ui.htmleditor_ui import Ui_MainWindow
 from pyhtmleditor.ui.inserthtmldialog_ui import Ui_Dialog
 
@@ -38,14 +45,23 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         QMainWindow.__init__(self, None)
         self.setupUi(self)
         self.sourceDirty = True
+        self.sourceLines = None
+        # split long (e.g. minified) lines into segments in the source view
+        self.sourceLineLimit = sourcetext.LongLine
         self.highlighter = None
         self.insertHtmlDialog = None
+        self.insertHtmlHighlighter = None
         self.tabWidget.setTabText(0, "Normal View")
         self.tabWidget.setTabText(1, "HTML Source")
         self.tabWidget.currentChanged.connect(self.changeTab)
         self.resize(800, 600)
 
+        # the source view is read-only and updated in place, so it needs
+        # no undo history
+        self.plainTextEdit.setUndoRedoEnabled(False)
         self.highlighter = Highlighter(self.plainTextEdit.document())
+        self.highlighter.setLazy(self.plainTextEdit)
+        self.highlighter.setBackground(True)
 
         spacer = QWidget(self)
         spacer.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Minimum)
@@ -63,6 +79,30 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         self.zoomSlider.valueChanged.connect(self.changeZoom)
         self.standardToolBar.insertWidget(self.actionZoomIn, self.zoomSlider)
 
+        # documents are written on a worker thread
+        self.saver = DocumentSaver(self)
+        self.saver.progress.connect(self.saveProgress)
+        self.saver.finished.connect(self.saveFinished)
+        self.pendingSaves = collections.deque()
+        self.closeAfterSave = False
+        # called once the save started by maybeSave() succeeded
+        self.afterSave = None
+
+        # crash recovery journal next to the file
+        self.autosaver = Autosaver(self.webView.page(), self)
+        self.autosaver.failed.connect(self.autosaveFailed)
+        self.documentRecovered = False
+        # served by the scheme handler while the recovered document is open
+        self.recoveredUrl = None
+
+        # large images are downscaled in worker processes, the original
+        # is shown at the display size until the variants are ready;
+        # imageJobs maps a job to the src of its original
+        self.downscaleImages = True
+        self.imagePipeline = imagepipeline.ImagePipeline(self)
+        self.imagePipeline.finished.connect(self.imageProcessed)
+        self.imageJobs = {}
+
         self.actionFileNew.triggered.connect(self.fileNew)
         self.actionFileOpen.triggered.connect(self.fileOpen)
         self.actionFileSave.triggered.connect(self.fileSave)
@@ -74,7 +114,8 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         self.actionZoomOut.triggered.connect(self.zoomOut)
         self.actionZoomIn.triggered.connect(self.zoomIn)
 
-        # these are forward to internal QWebView
+        # these are forward to internal QWebView, wired once here
+        self.pageActions = {}
         self._forward_action(self.actionEditUndo, QtWebEngineWidgets.QWebEnginePage.Undo)
         self._forward_action(self.actionEditRedo, QtWebEngineWidgets.QWebEnginePage.Redo)
         self._forward_action(self.actionEditCut, QtWebEngineWidgets.QWebEnginePage.Cut)
@@ -112,22 +153,52 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         self.actionFormatNumberedList.triggered.connect(self.formatNumberedList)
         self.actionFormatBulletedList.triggered.connect(self.formatBulletedList)
 
+        # checkable actions mirroring document.queryCommandState, all of
+        # them are queried together in a single round trip
+        self.formatActions = { 'bold' : self.actionFormatBold,
+                               'italic' : self.actionFormatItalic,
+                               'underline' : self.actionFormatUnderline,
+                               'strikeThrough' : self.actionFormatStrikethrough,
+                               'justifyLeft' : self.actionFormatAlignLeft,
+                               'justifyCenter' : self.actionFormatAlignCenter,
+                               'justifyRight' : self.actionFormatAlignRight,
+                               'justifyFull' : self.actionFormatAlignJustify,
+                               'insertUnorderedList' : self.actionFormatBulletedList,
+                               'insertOrderedList' : self.actionFormatNumberedList }
+
+        # number of runJavaScript calls that waited for a reply
+        self.jsRoundTrips = 0
+
         # enable pasting
         self.webView.settings().setAttribute(QtWebEngineWidgets.QWebEngineSettings.JavascriptCanAccessClipboard, True)
         self.webView.settings().setAttribute(QtWebEngineWidgets.QWebEngineSettings.JavascriptCanPaste, True)
         self.webView.page().settings().setAttribute(QtWebEngineWidgets.QWebEngineSettings.JavascriptCanAccessClipboard, True)
         self.webView.page().settings().setAttribute(QtWebEngineWidgets.QWebEngineSettings.JavascriptCanPaste, True)
 
-        # necessary to sync our actions
-        self.webView.page().selectionChanged.connect(self.adjustActions)
+        # documents are loaded from disk through the doc: scheme
+        self.schemeHandler = schemehandler.install(self.webView.page().profile())
+
+        # necessary to sync our actions, bursts of selection changes are
+        # coalesced into one refresh per frame
+        self.selectionThrottle = Throttle(self.adjustActions, parent=self)
+        self.webView.page().selectionChanged.connect(self.selectionThrottle.trigger)
 
         self.webView.setFocus()
 
         self.setCurrentFileName('')
 
+        # editing runtime used by execCommand and queryCommandStates, it
+        # reports caret moves and document mutations over the channel
+        self.changeCount = 0
+        # top level body children changed since the last source refresh
+        # as (first, last); only those are serialized again and spliced
+        # into sourceParts, the serialized body children shown in the
+        # source view
+        self.dirtyRange = None
+        self.sourceParts = None
         self.webchannel = QtWebChannel.QWebChannel(self)
-        self.webView.page().setWebChannel(self.webchannel)
-        self.webchannel.registerObject('MyChannel', self)
+        self.webchannel.registerObject(jsruntime.ChannelObject, self)
+        jsruntime.install(self.webView.page(), self.webchannel)
 
         initialFile = str("./src/pyhtmleditor/ui/example.html")
         args = QCoreApplication.arguments()
@@ -139,49 +210,78 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
 
         self.adjustActions()
         self.adjustSource()
-        self.setWindowModified(False)
+        self.setWindowModified(self.documentRecovered)
         self.changeZoom(100)
 
     def _forward_action(self, action1, action2):
+        if action1 in self.pageActions:
+            return
+        self.pageActions[action1] = action2
         action1.triggered.connect(self.webView.pageAction(action2).trigger)
-        self.webView.pageAction(action2).changed.connect(self.adjustActions)
+        self.webView.pageAction(action2).changed.connect(
+                lambda: self._follow_enable(action1, action2))
 
     def _follow_enable(self, a1, a2):
-        a1.setEnabled(self.webView.pageAction(a2).isEnabled())
+        self._set_action_state(a1, 'enabled', self.webView.pageAction(a2).isEnabled())
 
     def _follow_check(self, a1, a2):
-        a1.setChecked(self.webView.pageAction(a2).isChecked())
+        self._set_action_state(a1, 'checked', self.webView.pageAction(a2).isChecked())
+
+    def _set_action_state(self, action, prop, value):
+        # only touch the action when its state really changes, compared
+        # with the action itself as the user may toggle it too
+        if prop == 'enabled':
+            if action.isEnabled() != value:
+                action.setEnabled(value)
+        elif action.isChecked() != value:
+            action.setChecked(value)
+
+    def maybeSave(self, proceed=None):
+        """
+        Ask whether to save a modified document before it is replaced
 
-    def maybeSave(self):
+        Returns True when the caller may go on at once. When the changes
+        are saved, False is returned and proceed is called once the save
+        has been written successfully, saves finish asynchronously.
+        """
         if not self.isWindowModified():
             return True
         ret = QMessageBox.warning(self, self.tr("HTML Editor"),
                 self.tr("The document has been modified.\nDo you want to save your changes?"),
                 QMessageBox.Save|QMessageBox.Discard|QMessageBox.Cancel)
         if ret == QMessageBox.Save:
-            return self.fileSave()
+            self.afterSave = proceed
+            if not self.fileSave():
+                self.afterSave = None
+            return False
         elif ret == QMessageBox.Cancel:
             return False
         return True
 
     def fileNew(self):
-        if self.maybeSave():
-            self.webView.setHtml("<p></p>")
-            self.webView.setFocus()
-            #self.webView.page().setContentEditable(True)
-            #self.run_javascript("document.designMode = true;")
-            #self.webView.page().runJavaScript("document.body.contentEditable = true;");
-            self.setCurrentFileName('')
-            self.setWindowModified(False)
-
-            # quirk in QWebView: need an initial mouse click to show the cursor
-            mx = self.webView.width() / 2
-            my = self.webView.height() / 2
-            center = QPoint(mx, my)
-            e1 = QMouseEvent(QEvent.MouseButtonPress, center, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
-            e2 = QMouseEvent(QEvent.MouseButtonRelease, center, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
-            QApplication.postEvent(self.webView, e1)
-            QApplication.postEvent(self.webView, e2)
+        if self.maybeSave(self.newDocument):
+            self.newDocument()
+
+    def newDocument(self):
+        self.dropRecovered()
+        self.webView.setHtml("<p></p>")
+        self.webView.setFocus()
+        #self.webView.page().setContentEditable(True)
+        #self.run_javascript("document.designMode = true;")
+        #self.webView.page().runJavaScript("document.body.contentEditable = true;");
+        self.setCurrentFileName('')
+        self.setWindowModified(False)
+        self.dirtyRange = None
+        self.sourceParts = None
+
+        # quirk in QWebView: need an initial mouse click to show the cursor
+        mx = self.webView.width() / 2
+        my = self.webView.height() / 2
+        center = QPoint(mx, my)
+        e1 = QMouseEvent(QEvent.MouseButtonPress, center, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
+        e2 = QMouseEvent(QEvent.MouseButtonRelease, center, Qt.LeftButton, Qt.LeftButton, Qt.NoModifier)
+        QApplication.postEvent(self.webView, e1)
+        QApplication.postEvent(self.webView, e2)
 
     def fileOpen(self):
         fn,file_type = QFileDialog.getOpenFileName(self, self.tr("Open File..."),
@@ -190,29 +290,117 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
             self.load(fn)
 
     def fileSave(self):
+        # True once the save is started, saveFinished reports the result
         if not self.fileName or self.fileName.startswith(str(":/")):
             return self.fileSaveAs()
 
-        fd = QFile(self.fileName)
-        success = fd.open(QIODevice.WriteOnly)
+        # edits made after this point keep the document modified
+        self.pendingSaves.append(self.changeCount)
+        self.saver.save(self.webView.page(), self.fileName)
+        return True
+
+    def saveProgress(self, fileName, written, total):
+        self.statusBar().showMessage(self.tr("Saving {name}... {percent}%").format(
+                name=QFileInfo(fileName).fileName(), percent=100 * written // max(total, 1)))
+
+    def saveFinished(self, fileName, success, error):
+        # saves finish in the order they were started
+        changeCount = self.pendingSaves.popleft()
         if success:
-            content = self.webView.page().toHtml()
-            data = content.toUtf8()
-            c = fd.write(data)
-            success = (c >= data.length())
+            self.statusBar().showMessage(self.tr("Saved {name}").format(
+                    name=QFileInfo(fileName).fileName()), 2000)
+            if fileName == self.fileName and changeCount == self.changeCount:
+                self.setWindowModified(False)
+                self.autosaver.discard()
+        else:
+            self.statusBar().clearMessage()
+            self.closeAfterSave = False
+            self.afterSave = None
+            QMessageBox.warning(self, self.tr("HTML Editor"),
+                    self.tr("Could not save {name}:\n{error}").format(name=fileName, error=error))
 
-        self.setWindowModified(False)
-        return success
+        if self.isSaving():
+            return
+        if self.closeAfterSave:
+            self.close()
+        elif self.afterSave is not None:
+            proceed, self.afterSave = self.afterSave, None
+            # changes made while saving are not dropped
+            if not self.isWindowModified():
+                proceed()
 
     def fileSaveAs(self):
         fn,file_type = QFileDialog.getSaveFileName(self, self.tr("Save as..."),
                 '', self.tr("HTML-Files (*.htm *.html);;All Files (*)"))
         if not fn:
             return False
-        if not fn.endswith(".htm", Qt.CaseInsensitive) or not fn.endswith(".html", Qt.CaseInsensitive):
+        if not fn.lower().endswith((".htm", ".html")):
             fn += ".htm"
+        directory = self.documentDirectory()
         self.setCurrentFileName(fn)
-        return self.fileSave()
+        # the images move along before the save, which counts from now
+        self.pendingSaves.append(self.changeCount)
+        self.run_javascript(jsruntime.imagesCall(),
+                lambda urls: self.relocateImages(urls, directory))
+        return True
+
+    def relocateImages(self, urls, directory):
+        """
+        Add the images of the document to the store next to fileName
+
+        Their src and srcset attributes are rewritten relative to the new
+        directory, then the save started by fileSaveAs is written.
+
+        :param urls: JSON list of the image URLs in the document
+        :param directory: Directory the document was in, None if untitled
+        """
+        try:
+            urls = json.loads(urls)
+        except (TypeError, ValueError):
+            urls = []
+        store = self.assetStore()
+        moved = {}
+        for url in set(urls):
+            path = self.assetPath(url, directory)
+            if path is None:
+                continue
+            try:
+                newUrl = self.assetUrl(store.add(path, assets.blobDigest(path)))
+            except (IOError, OSError) as e:
+                QMessageBox.warning(self, self.tr("HTML Editor"),
+                        self.tr("Could not store {name}:\n{error}").format(name=path, error=e))
+                continue
+            if newUrl != url:
+                moved[url] = newUrl
+
+        if moved:
+            # images still being processed are found by their new src
+            for job, src in self.imageJobs.items():
+                self.imageJobs[job] = moved.get(src, src)
+            # the runtime drops the records of the relocation
+            self.sourceDirty = True
+            self.sourceParts = None
+            self.run_javascript(jsruntime.relocateCall(moved), self.saveRelocated)
+        else:
+            self.saveRelocated()
+
+    def saveRelocated(self, result=None):
+        self.saver.save(self.webView.page(), self.fileName)
+
+    def isSaving(self):
+        # saves of fileSaveAs wait for their images before the saver has them
+        return bool(self.pendingSaves)
+
+    def assetPath(self, url, directory):
+        # the stored blob an image URL refers to, if any
+        qurl = QUrl(url)
+        if qurl.isLocalFile():
+            path = qurl.toLocalFile()
+        elif qurl.isRelative() and directory:
+            path = os.path.normpath(os.path.join(directory, qurl.path()))
+        else:
+            return None
+        return path if assets.blobDigest(path) else None
 
     def insertImage(self):
         filters = self.tr("Common Graphics (*.png *.jpg *.jpeg *.gif);;");
@@ -228,8 +416,66 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         if not QFile.exists(fn):
             return
 
-        url = QUrl.fromLocalFile(fn)
-        self.execCommand("insertImage", url.toString())
+        # images are stored once by content, next to the document
+        try:
+            path = self.assetStore().add(fn)
+        except (IOError, OSError) as e:
+            QMessageBox.warning(self, self.tr("HTML Editor"),
+                    self.tr("Could not store {name}:\n{error}").format(name=fn, error=e))
+            return
+
+        src = self.assetUrl(path)
+        if not self.downscaleImages or not imagepipeline.needsScaling(path):
+            self.execCommand("insertImage", src)
+            return
+
+        job = self.imagePipeline.process(path, self.assetStore())
+        self.imageJobs[job] = src
+        size = imagepipeline.displaySize(imagepipeline.imageSize(path))
+        self.execCommand("insertHTML", self.imageHtml(src, size))
+
+    def imageHtml(self, src, size):
+        # the original at its final size, the layout does not jump when
+        # the variants replace it, and a document saved before is valid
+        return '<img src="{0}" width="{1}" height="{2}" alt="">'.format(
+                html.escape(src), size.width(), size.height())
+
+    def autosaveFailed(self, error):
+        self.statusBar().showMessage(self.tr("Autosave failed: {error}").format(
+                error=error), 5000)
+
+    def imageProcessed(self, job, variants, error):
+        original = self.imageJobs.pop(job, None)
+        if original is None:
+            return
+        if not variants:
+            # the image stays as inserted
+            self.statusBar().showMessage(self.tr("Could not downscale the image: {error}").format(
+                    error=error), 5000)
+            return
+        srcset = ", ".join("{0} {1}x".format(self.assetUrl(path), scale) for path, scale in variants)
+        self.run_javascript(jsruntime.setImageCall(original, self.assetUrl(variants[0][0]), srcset))
+
+    def assetUrl(self, path):
+        if self.hasDocumentDirectory():
+            return assets.relativeUrl(path, self.documentDirectory())
+        return QUrl.fromLocalFile(path).toString()
+
+    def hasDocumentDirectory(self):
+        return bool(self.fileName) and not self.fileName.startswith(":/")
+
+    def documentDirectory(self):
+        if not self.hasDocumentDirectory():
+            return None
+        return os.path.dirname(os.path.abspath(self.fileName))
+
+    def assetStore(self):
+        # shared by all documents, backs the per directory stores
+        cache = assets.AssetStore(os.path.join(
+                QStandardPaths.writableLocation(QStandardPaths.AppDataLocation), assets.AssetDir))
+        if not self.hasDocumentDirectory():
+            return cache
+        return assets.storeForDocument(self.fileName, cache)
 
     def guessUrlFromString(self, string):
         urlStr = string.trimmed()
@@ -270,16 +516,15 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
             self.insertHtmlDialog = HtmlDialog()
             self.insertHtmlDialog.buttonBox.accepted.connect(self.insertHtmlDialog.accept)
             self.insertHtmlDialog.buttonBox.rejected.connect(self.insertHtmlDialog.reject)
+            # kept with the dialog, its document is only cleared between uses
+            self.insertHtmlHighlighter = Highlighter(self.insertHtmlDialog.plainTextEdit.document())
 
         self.insertHtmlDialog.plainTextEdit.clear()
         self.insertHtmlDialog.plainTextEdit.setFocus()
-        hilite = Highlighter(self.insertHtmlDialog.plainTextEdit.document())
 
         if self.insertHtmlDialog.exec_() == QDialog.Accepted:
             self.execCommand("insertHTML", self.insertHtmlDialog.plainTextEdit.toPlainText())
 
-        del hilite
-
     def zoomOut(self):
         percent = self.webView.zoomFactor() * 100
         if percent > 25:
@@ -306,16 +551,22 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         self.webView.triggerPageAction(QtWebEngineWidgets.QWebEnginePage.SelectAll)
 
     def execCommand(self, cmd, arg=None):
-        if arg:
-            js = 'document.execCommand("{cmd}", false, "{arg}");'.format(cmd=cmd,arg=arg)
-        else:
-            js = 'document.execCommand("{cmd}", false, null);'.format(cmd=cmd)
-        self.run_javascript(js)
+        self.run_javascript(jsruntime.execCall(cmd, arg))
 
     def queryCommandState(self, cmd):
-        js = 'document.queryCommandState("{cmd}") + ":{cmd}";'.format(cmd=cmd)
-        result = self.run_javascript(js, self.js_callback)
-        return str(result).strip().lower() == "true"
+        self.queryCommandStates([cmd])
+
+    def queryCommandStates(self, cmds, callback=None):
+        """
+        Query the state of several commands in one JavaScript round trip
+
+        :param cmds: Command names, e.g. ["bold", "justifyLeft"]
+        :param callback: Called with a dict mapping each command to its
+            state. Defaults to updateFormatActions
+        """
+        callback = callback or self.updateFormatActions
+        self.run_javascript(jsruntime.statesCall(cmds),
+                lambda result: self.js_callback(result, callback))
 
     def styleParagraph(self):
         self.execCommand("formatBlock", "p")
@@ -395,25 +646,16 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
             self.execCommand("hiliteColor", color.name())
 
     def adjustActions(self):
-        self._forward_action(self.actionEditUndo, QtWebEngineWidgets.QWebEnginePage.Undo)
-        self._forward_action(self.actionEditRedo, QtWebEngineWidgets.QWebEnginePage.Redo)
-        self._forward_action(self.actionEditCut, QtWebEngineWidgets.QWebEnginePage.Cut)
-        self._forward_action(self.actionEditCopy, QtWebEngineWidgets.QWebEnginePage.Copy)
-        self._forward_action(self.actionEditPaste, QtWebEngineWidgets.QWebEnginePage.Paste)
-        self._forward_action(self.actionFormatBold, QtWebEngineWidgets.QWebEnginePage.ToggleBold)
-        self._forward_action(self.actionFormatItalic, QtWebEngineWidgets.QWebEnginePage.ToggleItalic)
-        self._forward_action(self.actionFormatUnderline, QtWebEngineWidgets.QWebEnginePage.ToggleUnderline)
+        for action, pageAction in self.pageActions.items():
+            self._follow_enable(action, pageAction)
+
+        self.queryCommandStates(self.formatActions)
 
-        self.queryCommandState("bold")
-        self.queryCommandState("italic")
-        self.queryCommandState("underLine")
-        self.queryCommandState("strikeThrough")
-        self.queryCommandState("alignLeft")
-        self.queryCommandState("alignCenter")
-        self.queryCommandState("alignRight")
-        self.queryCommandState("alignJustify")
-        self.queryCommandState("orderedList")
-        self.queryCommandState("unorderedList")
+    def updateFormatActions(self, states):
+        for cmd, status in states.items():
+            action = self.formatActions.get(cmd)
+            if action is not None:
+                self._set_action_state(action, 'checked', bool(status))
 
     def adjustSource(self):
         self.setWindowModified(True)
@@ -424,11 +666,62 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
 
     def changeTab(self, index):
         if self.sourceDirty and index == 1:
-            self.webView.page().toHtml(self.changeTabCallback)
+            if self.sourceParts is None:
+                script = jsruntime.serializeCall()
+            else:
+                count = len(self.sourceParts)
+                first, last = self.dirtyRange or (count, count - 1)
+                script = jsruntime.serializeCall(first, last)
+            # changes reported while the call is running mark the source
+            # dirty again
+            self.sourceDirty = False
+            self.dirtyRange = None
+            self.run_javascript(script, self.changeTabCallback)
+
+    def changeTabCallback(self, result):
+        try:
+            source = json.loads(result)
+        except (TypeError, ValueError):
+            print('unexpected source: %s' % result)
+            self.sourceDirty = True
+            self.sourceParts = None
+            return
+        parts = source["parts"]
+        first = source["first"]
+        if first == 0 and len(parts) == source["count"]:
+            self.sourceParts = parts
+        elif self.sourceParts is not None and len(self.sourceParts) == source["count"]:
+            self.sourceParts[first:first + len(parts)] = parts
+        else:
+            # body children were added or removed since the last refresh
+            self.sourceParts = None
+            self.run_javascript(jsruntime.serializeCall(), self.changeTabCallback)
+            return
+        self.updateSource(source["head"] + "".join(self.sourceParts) + source["tail"])
 
-    def changeTabCallback(self, html):
-        self.plainTextEdit.setPlainText(html)
-        self.sourceDirty = False
+    def updateSource(self, html):
+        """
+        Show html in the source view, replacing only the changed lines
+
+        Untouched blocks keep their layout and highlighting state. Lines
+        longer than sourceLineLimit are shown as several blocks, so no
+        single block has to be highlighted and laid out at once.
+        """
+        segments = sourcetext.splitSegments(html, self.sourceLineLimit)
+        if self.sourceLines is None:
+            self.sourceLines = segments
+            self.replaceSourceLines(0, self.plainTextEdit.document().blockCount(), segments)
+            return
+
+        diff = sourcetext.diffLines(self.sourceLines, segments)
+        self.sourceLines = segments
+        if diff is None:
+            return
+        start, oldEnd, newEnd = diff
+        self.replaceSourceLines(start, oldEnd, segments[start:newEnd])
+
+    def replaceSourceLines(self, start, end, segments):
+        replaceLines(self.plainTextEdit.document(), start, end, segments)
 
     def openLink(self, url):
         msg = "Open {url} ?".format(url=str(url))
@@ -447,24 +740,67 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         self.zoomSlider.setValue(percent)
 
     def closeEvent(self, event):
-        if self.maybeSave():
+        if self.closeAfterSave and not self.isSaving():
+            self.highlighter.stopBackgroundScan()
+            self.imagePipeline.shutdown()
             event.accept()
+        elif self.maybeSave(self.closeWhenSaved):
+            if self.isSaving():
+                # close once the save has been written
+                self.closeAfterSave = True
+                event.ignore()
+            else:
+                self.autosaver.discard()
+                self.highlighter.stopBackgroundScan()
+                self.imagePipeline.shutdown()
+                event.accept()
         else:
             event.ignore()
 
+    def closeWhenSaved(self):
+        self.closeAfterSave = True
+        self.close()
+
     def load(self, f):
-        if not QFile.exists(f):
-            return False
-        fd = QFile(f)
-        if not fd.open(QFile.ReadOnly):
+        info = QFileInfo(f)
+        if not info.isFile() or not info.isReadable():
             return False
 
-        data = fd.readAll()
-        self.webView.setContent(data, "text/html")
+        # streamed by the scheme handler, relative assets resolve
+        # against the directory of the file
+        self.schemeHandler.allow(info.absolutePath())
+
+        # offer the changes journaled before a crash
+        self.dropRecovered()
+        url = schemehandler.urlForFile(f, document=True)
+        self.autosaver.setFileName(f)
+        recovered = self.autosaver.recover()
+        self.documentRecovered = False
+        if recovered is not None:
+            ret = QMessageBox.question(self, self.tr("HTML Editor"),
+                    self.tr("{name} has unsaved changes from an earlier session.\nDo you want to recover them?").format(
+                    name=info.fileName()), QMessageBox.Yes|QMessageBox.No)
+            if ret == QMessageBox.Yes:
+                url = self.recoveredUrl = self.schemeHandler.setContent(f, recovered.encode("utf-8"))
+                self.documentRecovered = True
+            else:
+                self.autosaver.discard()
+
+        # the source of the previous document is not needed any more
+        self.highlighter.stopBackgroundScan()
+        self.webView.load(url)
 
         self.setCurrentFileName(f)
+        self.setWindowModified(self.documentRecovered)
+        self.dirtyRange = None
+        self.sourceParts = None
         return True
 
+    def dropRecovered(self):
+        if self.recoveredUrl is not None:
+            self.schemeHandler.removeContent(self.recoveredUrl)
+            self.recoveredUrl = None
+
     def setCurrentFileName(self, fileName):
         self.fileName = fileName
         if not fileName:
@@ -474,6 +810,7 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
 
         self.setWindowTitle("{shownName}[*] - {app_name}".format(shownName=shownName,app_name="HTML Editor"))
         self.setWindowModified(False)
+        self.autosaver.setFileName(fileName)
 
         allowSave = True
         if not fileName or fileName.startswith(str(":/")):
@@ -482,29 +819,59 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
 
     @QtCore.pyqtSlot(str)
     def js_new_pos(self, pos):
-        self.adjustActions()
+        self.selectionThrottle.trigger()
+
+    @QtCore.pyqtSlot(str)
+    def js_mutations(self, changes):
+        """
+        Receive a batch of document changes from the runtime
 
-    def js_callback(self, result):
-        # Result is formated like this: <true|false>:<formatting>
-        results = result.split(':')
-        if len(results) != 2:
+        Each change is a dict with the kind of change in "t" ("l" child
+        list, "t" text, "a" attribute), the child index path from body to
+        the changed node in "p", None for nodes outside of the body, the
+        attribute name in "a" and the number of added and removed nodes
+        in "n" and "r".
+        """
+        try:
+            changes = json.loads(changes)
+        except ValueError:
+            print('unexpected changes: %s' % changes)
+            return
+        if not changes:
+            return
+        self.changeCount += len(changes)
+        self.markDirty(changes)
+        self.adjustSource()
+        self.autosaver.schedule()
+
+    def markDirty(self, changes):
+        # only the range of top level body children touched is kept, so
+        # a long session does not pile up one record per keystroke; the
+        # document around the body children is serialized on every refresh
+        first, last = self.dirtyRange or (None, -1)
+        for change in changes:
+            path = change.get("p")
+            if path is None:
+                # outside of the body
+                continue
+            if not path:
+                if change.get("t") == "l":
+                    # body children were added or removed
+                    self.sourceParts = None
+                continue
+            first = path[0] if first is None else min(first, path[0])
+            last = max(last, path[0])
+        if first is not None:
+            self.dirtyRange = (first, last)
+
+    def js_callback(self, result, callback):
+        # Result is a JSON object: {"<formatting>": <true|false>, ...}
+        try:
+            states = json.loads(result)
+        except (TypeError, ValueError):
             print('unexpected result: %s' % result)
             return
-        status = results[0]
-        formatting = results[1]
-        status = True if status == 'true' else False
-        format_action_map = { 'bold' : self.actionFormatBold,
-                              'italic' : self.actionFormatItalic,
-                              'underLine' : self.actionFormatUnderline,
-                              'strikeThrough' : self.actionFormatStrikethrough,
-                              'alignLeft' : self.actionFormatAlignLeft,
-                              'alignCenter' : self.actionFormatAlignCenter,
-                              'alignRight' : self.actionFormatAlignRight,
-                              'alignJustify' : self.actionFormatAlignJustify,
-                              'unorderedList' : self.actionFormatBulletedList,
-                              'orderedList' : self.actionFormatNumberedList }
-        action_to_set = format_action_map[formatting]
-        action_to_set.setChecked(status)
+        callback(states)
 
     def run_javascript(self, script, callback=None):
         """
@@ -514,7 +881,8 @@ class HtmlEditor(QMainWindow, Ui_MainWindow):
         :param callback: Use callback to handle result. Defaults to None
         """
         if not callback:
-            self.webView.page().runJavaScript(script)
+            self.webView.page().runJavaScript(script, jsruntime.WorldId)
         else:
-            self.webView.page().runJavaScript(script, callback)
+            self.jsRoundTrips += 1
+            self.webView.page().runJavaScript(script, jsruntime.WorldId, callback)
             return False
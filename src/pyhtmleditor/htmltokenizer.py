@@ -0,0 +1,556 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+HTML tokenizer behind the source highlighter, independent of Qt
+
+Text is scanned one line at a time. The state at the end of a line is
+passed to the scan of the next line, like block states are passed from
+block to block by QSyntaxHighlighter. Each scanner state jumps to the
+next interesting character with a compiled regular expression.
+
+The contents of <style> and <script> elements are scanned as CSS and
+JavaScript. A state is a single integer: the HTML state in the low
+byte, the embedded language in the next two bits and the state of the
+embedded scanner above those, see packState. State_Text is always -1.
+"""
+
+import re
+import codecs
+from html.entities import html5
+
+# token kinds
+DocType = 0
+Entity = 1
+Tag = 2
+Comment = 3
+AttributeName = 4
+AttributeValue = 5
+Keyword = 6
+String = 7
+Number = 8
+Property = 9
+Selector = 10
+
+# scanner states
+State_Text = -1
+State_DocType = 0
+State_Comment = 1
+State_TagStart = 2
+State_TagName = 3
+State_InsideTag = 4
+State_AttributeName = 5
+State_SingleQuote = 6
+State_DoubleQuote = 7
+State_AttributeValue = 8
+State_Embedded = 9
+
+# embedded languages
+Lang_None = 0
+Lang_CSS = 1
+Lang_JS = 2
+
+# embedded scanner states, CSS keeps whether it is inside a rule block
+# in the lowest bit
+Sub_Code = 0
+Sub_Comment = 1
+Sub_SingleQuote = 2
+Sub_DoubleQuote = 3
+Sub_Template = 4
+Sub_LineComment = 5
+Sub_Regex = 6
+Sub_RegexClass = 7
+Sub_Block = 8
+
+_LangShift = 8
+_SubShift = 10
+
+_Languages = {"style": Lang_CSS, "script": Lang_JS}
+
+# named character references, e.g. "amp" for "&amp;"
+EntityNames = frozenset(name[:-1] for name in html5 if name.endswith(";"))
+
+# highest valid code point of a numeric character reference
+MaxCodePoint = 0x10FFFF
+
+# every part is bounded, so matching at a '&' never reads more than the
+# longest valid reference and a line is scanned in linear time
+_text = re.compile(r"[<&]")
+_entity = re.compile(r"&(?:#[xX]([0-9a-fA-F]{1,6})|#([0-9]{1,7})|([A-Za-z][A-Za-z0-9]{0,%d}));"
+        % (max(len(name) for name in EntityNames) - 1))
+_nonSpace = re.compile(r"\S")
+_tagNameEnd = re.compile(r"[\s>]")
+_insideTag = re.compile(r"[^\s/]")
+_attributeNameEnd = re.compile(r"[=/>]")
+_unquotedValueEnd = re.compile(r"[\s/>]")
+
+_closers = {
+    Lang_CSS: re.compile(r"</style", re.IGNORECASE),
+    Lang_JS: re.compile(r"</script", re.IGNORECASE),
+}
+
+_jsKeywords = (
+    "async await break case catch class const continue debugger default "
+    "delete do else export extends false finally for function if import "
+    "in instanceof let new null of return static super switch this throw "
+    "true try typeof undefined var void while with yield").split()
+
+_jsToken = re.compile(r"""
+    (?P<line>//) | (?P<block>/\*) | (?P<slash>/) | (?P<quote>['"`]) |
+    (?P<number>\b(?:0[xX][0-9a-fA-F]+|\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)\b) |
+    (?P<keyword>\b(?:%s)\b)
+    """ % "|".join(_jsKeywords), re.VERBOSE)
+
+# CSS outside of and inside of rule blocks
+_cssRule = re.compile(r"""
+    (?P<block>/\*) | (?P<quote>['"]) | (?P<open>\{) | (?P<close>\}) |
+    (?P<keyword>@[\w-]+) |
+    (?P<selector>[^\s{};,/'"@][^{};,/'"@]*)
+    """, re.VERBOSE)
+
+_cssDeclaration = re.compile(r"""
+    (?P<block>/\*) | (?P<quote>['"]) | (?P<open>\{) | (?P<close>\}) |
+    (?P<keyword>@[\w-]+|!important) |
+    (?P<property>(?<![\w-])[\w-]+(?=\s*:)) |
+    (?P<number>\#[0-9a-fA-F]{3,8}\b|(?<![\w-])-?(?:\d+\.?\d*|\.\d+)(?:%|[a-zA-Z]+)?)
+    """, re.VERBOSE)
+
+# closing delimiter and the rest of a quoted string or comment
+_stringEnd = {
+    Sub_SingleQuote: re.compile(r"(?:[^'\\]|\\.)*'"),
+    Sub_DoubleQuote: re.compile(r'(?:[^"\\]|\\.)*"'),
+    Sub_Template: re.compile(r"(?:[^`\\]|\\.)*`"),
+}
+_quotes = {"'": Sub_SingleQuote, '"': Sub_DoubleQuote, "`": Sub_Template}
+
+# the rest of a regular expression literal up to '/', '[' or ']', quotes
+# in it start no string
+_regexEnd = {
+    Sub_Regex: re.compile(r"(?:[^/\\\[]|\\.)*"),
+    Sub_RegexClass: re.compile(r"(?:[^\]\\]|\\.)*"),
+}
+_regexFlags = re.compile(r"[A-Za-z]*")
+
+# a '/' after one of these starts a regular expression, after anything
+# else, e.g. a name, a number or ')', it divides
+_regexPrefix = frozenset("(,=:[!&|?{};+-*%<>~^")
+_regexKeywords = frozenset(
+    "await case delete do else in instanceof new of return throw "
+    "typeof void yield".split())
+
+
+def packState(base, lang=Lang_None, sub=Sub_Code):
+    if base == State_Text:
+        return State_Text
+    return base | (lang << _LangShift) | (sub << _SubShift)
+
+
+def unpackState(state):
+    """Return the (HTML state, embedded language, embedded state) of state"""
+    if state < 0:
+        return State_Text, Lang_None, Sub_Code
+    return state & 0xff, (state >> _LangShift) & 3, state >> _SubShift
+
+
+def entityLength(text, pos):
+    """
+    Return the length of the character reference at text[pos], or 0
+
+    Named references are looked up in EntityNames, decimal and hex
+    references have to be valid code points.
+
+    :param text: The line
+    :param pos: Position of the '&'
+    """
+    m = _entity.match(text, pos)
+    if m is None:
+        return 0
+    hexa, decimal, name = m.groups()
+    if name is not None:
+        valid = name in EntityNames
+    elif hexa is not None:
+        valid = int(hexa, 16) <= MaxCodePoint
+    else:
+        valid = int(decimal) <= MaxCodePoint
+    return m.end() - pos if valid else 0
+
+
+def _regexAllowed(text, pos):
+    # the previous token decides, the line start counts as an operator;
+    # each lookback stops at the previous token, so a line is still
+    # scanned in linear time
+    i = pos - 1
+    while i >= 0 and text[i].isspace():
+        i -= 1
+    if i < 0 or text[i] in _regexPrefix:
+        return True
+    start = i
+    while start >= 0 and (text[start].isalnum() or text[start] in "_$"):
+        start -= 1
+    return text[start + 1:i + 1] in _regexKeywords
+
+
+def _scanEmbedded(text, pos, end, lang, sub, spans, lineEnd=True):
+    """
+    Scan text[pos:end] as CSS or JavaScript starting in state sub
+
+    Returns the embedded state at end. Line comments, regular expression
+    literals and strings other than JavaScript template literals end with
+    the line, unless lineEnd is False because the line goes on in the
+    next segment.
+    """
+    append = spans.append
+    # CSS remembers if it is inside a rule block, JavaScript does not
+    block = sub & Sub_Block
+    sub &= ~Sub_Block
+
+    while pos < end:
+        if sub == Sub_LineComment:
+            append((pos, end - pos, Comment, packState(State_Embedded, lang, sub | block)))
+            pos = end
+            continue
+
+        if sub == Sub_Comment:
+            close = text.find("*/", pos, end)
+            stop = end if close < 0 else close + 2
+            if close >= 0:
+                sub = Sub_Code
+            append((pos, stop - pos, Comment,
+                    packState(State_Embedded, lang, sub | block)))
+            pos = stop
+            continue
+
+        if sub in (Sub_Regex, Sub_RegexClass):
+            stop = _regexEnd[sub].match(text, pos, end).end()
+            if stop < end:
+                c = text[stop]
+                if c == "\\":
+                    # escape cut off at the segment end
+                    stop = end
+                elif c == "[":
+                    sub = Sub_RegexClass
+                    stop += 1
+                elif c == "]":
+                    sub = Sub_Regex
+                    stop += 1
+                else:
+                    sub = Sub_Code
+                    stop = _regexFlags.match(text, stop + 1, end).end()
+            append((pos, stop - pos, String,
+                    packState(State_Embedded, lang, sub | block)))
+            pos = stop
+            continue
+
+        if sub != Sub_Code:
+            m = _stringEnd[sub].match(text, pos, end)
+            stop = end if m is None else m.end()
+            if m is not None:
+                sub = Sub_Code
+            append((pos, stop - pos, String,
+                    packState(State_Embedded, lang, sub | block)))
+            pos = stop
+            continue
+
+        if lang == Lang_JS:
+            token = _jsToken
+        else:
+            token = _cssDeclaration if block else _cssRule
+        m = token.search(text, pos, end)
+        if m is None:
+            break
+        kind = m.lastgroup
+        start = m.start()
+        pos = m.end()
+        if kind == "block":
+            sub = Sub_Comment
+            pos = start
+        elif kind == "quote":
+            sub = _quotes[m.group()]
+            append((start, 1, String, packState(State_Embedded, lang, sub | block)))
+        elif kind == "line":
+            sub = Sub_LineComment
+            pos = start
+        elif kind == "slash":
+            if _regexAllowed(text, start):
+                sub = Sub_Regex
+                append((start, 1, String, packState(State_Embedded, lang, sub | block)))
+        elif kind == "open":
+            block = Sub_Block
+        elif kind == "close":
+            block = 0
+        else:
+            if kind == "keyword":
+                kind = Keyword
+            elif kind == "number":
+                kind = Number
+            elif kind == "property":
+                kind = Property
+            else:
+                kind = Selector
+            append((start, pos - start, kind, packState(State_Embedded, lang, block)))
+
+    if lineEnd and end == len(text):
+        if sub in (Sub_LineComment, Sub_Regex, Sub_RegexClass):
+            sub = Sub_Code
+        elif sub in (Sub_SingleQuote, Sub_DoubleQuote) and not text.endswith("\\"):
+            sub = Sub_Code
+    return sub | block
+
+
+def scan(text, state=State_Text, lineEnd=True):
+    """
+    Scan one line of HTML
+
+    Returns the list of spans and the state at the end of the line.
+    Each span is a (start, length, kind, state) tuple, where state is
+    the scanner state right after the span.
+
+    :param text: The line, without the line separator
+    :param state: State at the end of the previous line
+    :param lineEnd: False if text is a segment the line goes on after,
+        the constructs ending with the line are then carried on.
+        Defaults to True
+    """
+    spans = []
+    append = spans.append
+    length = len(text)
+    pos = 0
+    state, lang, sub = unpackState(state)
+
+    while pos < length:
+
+        if state == State_Embedded:
+            m = _closers[lang].search(text, pos)
+            end = length if m is None else m.start()
+            sub = _scanEmbedded(text, pos, end, lang, sub, spans, lineEnd)
+            if m is None:
+                pos = length
+            else:
+                state, lang, sub = State_TagStart, Lang_None, Sub_Code
+                pos = end
+
+        elif state == State_Comment:
+            end = text.find("-->", pos)
+            if end < 0:
+                append((pos, length - pos, Comment, state))
+                pos = length
+            else:
+                state = State_Text
+                append((pos, end + 3 - pos, Comment, state))
+                pos = end + 3
+
+        elif state == State_DocType:
+            end = text.find(">", pos)
+            if end < 0:
+                append((pos, length - pos, DocType, state))
+                pos = length
+            else:
+                state = State_Text
+                append((pos, end + 1 - pos, DocType, state))
+                pos = end + 1
+
+        # at '<' in e.g. "<span>foo</span>"
+        elif state == State_TagStart:
+            m = _nonSpace.search(text, pos)
+            if m is None:
+                pos = length
+            elif text[m.start()] == ">":
+                state = State_Text
+                pos = m.end()
+            else:
+                state = State_TagName
+                pos = m.start()
+
+        # at 'b' in e.g "<blockquote>foo</blockquote>"
+        elif state == State_TagName:
+            m = _tagNameEnd.search(text, pos)
+            end = length if m is None else m.start()
+            lang = _Languages.get(text[pos:end].lstrip("<").lower(), lang)
+            if m is None:
+                append((pos, length - pos, Tag, packState(state, lang)))
+                pos = length
+            elif text[end] == ">":
+                state = State_Embedded if lang else State_Text
+                append((pos, m.end() - pos, Tag, packState(state, lang)))
+                pos = m.end()
+            else:
+                state = State_InsideTag
+                if end > pos:
+                    append((pos, end - pos, Tag, packState(state, lang)))
+                pos = end
+
+        # anywhere after tag name and before tag closing ('>')
+        elif state == State_InsideTag:
+            m = _insideTag.search(text, pos)
+            if m is None:
+                pos = length
+            elif text[m.start()] == ">":
+                state = State_Embedded if lang else State_Text
+                pos = m.end()
+            else:
+                state = State_AttributeName
+                pos = m.start()
+
+        # at 's' in e.g. <img src=bla.png/>
+        elif state == State_AttributeName:
+            m = _attributeNameEnd.search(text, pos)
+            if m is None:
+                append((pos, length - pos, AttributeName, packState(state, lang)))
+                pos = length
+            elif text[m.start()] == "=":
+                state = State_AttributeValue
+                append((pos, m.end() - pos, AttributeName, packState(state, lang)))
+                pos = m.end()
+            else:
+                state = State_InsideTag
+                if m.start() > pos:
+                    append((pos, m.start() - pos, AttributeName, packState(state, lang)))
+                pos = m.start()
+
+        # after '=' in e.g. <img src=bla.png/>
+        elif state == State_AttributeValue:
+            m = _nonSpace.search(text, pos)
+            if m is None:
+                pos = length
+                continue
+            pos = m.start()
+            ch = text[pos]
+            if ch == "'":
+                state = State_SingleQuote
+                pos += 1
+            elif ch == '"':
+                state = State_DoubleQuote
+                pos += 1
+            else:
+                # attribute value without quote
+                # just stop at space or tag delimiter
+                m = _unquotedValueEnd.search(text, pos)
+                end = length if m is None else m.start()
+                state = State_InsideTag
+                if end > pos:
+                    append((pos, end - pos, AttributeValue, packState(state, lang)))
+                pos = end
+
+        # after the opening quote in an attribute value
+        elif state == State_SingleQuote or state == State_DoubleQuote:
+            end = text.find("'" if state == State_SingleQuote else '"', pos)
+            if end < 0:
+                append((pos, length - pos, AttributeValue, packState(state, lang)))
+                pos = length
+            else:
+                state = State_InsideTag
+                append((pos, end + 1 - pos, AttributeValue, packState(state, lang)))
+                pos = end + 1
+
+        # State_Text, and anything unknown
+        else:
+            state, lang, sub = State_Text, Lang_None, Sub_Code
+            m = _text.search(text, pos)
+            if m is None:
+                break
+            pos = m.start()
+            if text[pos] == "&":
+                entity = entityLength(text, pos)
+                if entity:
+                    append((pos, entity, Entity, state))
+                    pos += entity
+                else:
+                    pos += 1
+            elif text.startswith("<!--", pos):
+                state = State_Comment
+            elif text[pos:pos + 9].upper() == "<!DOCTYPE":
+                state = State_DocType
+            else:
+                state = State_TagStart
+
+    return spans, packState(state, lang, sub)
+
+
+def segmentEnd(text, pos, limit):
+    """
+    Return where to end a segment of at most limit characters at pos
+
+    The segment ends after the last '>' in reach, or else after the
+    last space, so it usually ends between tags.
+    """
+    end = text.rfind(">", pos, pos + limit) + 1
+    if end <= pos:
+        end = text.rfind(" ", pos, pos + limit) + 1
+        if end <= pos:
+            end = pos + limit
+    return end
+
+
+def tokenizeStream(stream, chunkSize=64 * 1024, state=State_Text, encoding="utf-8"):
+    """
+    Generate the (offset, length, kind, state) spans of an HTML stream
+
+    The stream is read chunkSize characters (or bytes) at a time and
+    scanned line by line, the state is carried from line to line as
+    block states are. Lines longer than chunkSize, e.g. of minified
+    HTML, are scanned in segments, see segmentEnd, so memory stays
+    bounded. A segment carries its state on as the rest of the line.
+    Offsets count characters from the start of the stream.
+
+    :param stream: File-like object opened in text or binary mode
+    :param chunkSize: Characters or bytes read at a time
+    :param state: State to start in
+    :param encoding: Encoding of a binary stream
+    """
+    decoder = None
+    buffer = ""
+    offset = 0
+    while True:
+        data = stream.read(chunkSize)
+        eof = not data
+        if isinstance(data, bytes):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)("replace")
+            data = decoder.decode(data, final=eof)
+        buffer += data
+
+        lines = buffer.split("\n")
+        buffer = lines.pop()
+        for line in lines:
+            spans, state = scan(line, state)
+            for start, length, kind, spanState in spans:
+                yield (offset + start, length, kind, spanState)
+            offset += len(line) + 1
+
+        while len(buffer) > chunkSize or (eof and buffer):
+            # the rest of the buffer at the end of the stream ends a line
+            lineEnd = len(buffer) <= chunkSize
+            end = len(buffer) if lineEnd else segmentEnd(buffer, 0, chunkSize)
+            spans, state = scan(buffer[:end], state, lineEnd)
+            for start, length, kind, spanState in spans:
+                yield (offset + start, length, kind, spanState)
+            offset += end
+            buffer = buffer[end:]
+
+        if eof:
+            return
+
+
+def tokenize(text, state=State_Text):
+    """
+    Generate the (start, length, kind, state) spans of one line of HTML
+
+    :param text: The line, without the line separator
+    :param state: State at the end of the previous line
+    """
+    spans, state = scan(text, state)
+    for span in spans:
+        yield span
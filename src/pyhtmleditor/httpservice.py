@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Serve the editor normalizations and renderings over local HTTP
+
+Run headless with e.g.:
+
+    pyhtmleditor --serve --port 8765
+
+    curl -d '{"html": "<p>x</p>", "commands": [["bold", null]]}' localhost:8765/normalize
+    curl -d '{"html": "<p>x</p>"}' localhost:8765/sanitize
+    curl -d '{"html": "<p>x</p>", "kind": "pdf"}' localhost:8765/render > x.pdf
+    curl localhost:8765/metrics
+
+Requests are JSON objects, POSTed over HTTP/1.1 keep-alive connections.
+The documents are loaded without their scripts and cannot request
+anything from the network, see pagepool.sandboxPool().
+"""
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import collections
+import concurrent.futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PyQt5 import QtCore, QtWidgets
+
+from pyhtmleditor import batch, jsruntime, renderservice, schemehandler
+from pyhtmleditor.pagepool import MaxPages, sandboxPool
+from pyhtmleditor.stats import percentile
+
+Port = 8765
+
+# milliseconds a request may take in the editor
+RequestTimeout = 30000
+
+# latencies kept per endpoint for the metrics
+LatencyWindow = 1024
+
+# requests larger than this are refused, documents have to fit setHtml
+MaxRequestSize = 4 * 1024 * 1024
+
+# elements kept by the sanitizer, others are replaced by their content
+SafeElements = [
+    "html", "head", "title", "body", "a", "abbr", "address", "article", "aside", "b",
+    "bdi", "bdo", "big", "blockquote", "br", "caption", "center", "cite", "code", "col",
+    "colgroup", "dd", "del", "details", "dfn", "div", "dl", "dt", "em", "figcaption",
+    "figure", "font", "footer", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "i",
+    "img", "ins", "kbd", "li", "main", "mark", "nav", "ol", "p", "pre", "q", "s", "samp",
+    "section", "small", "span", "strike", "strong", "sub", "summary", "sup", "table",
+    "tbody", "td", "tfoot", "th", "thead", "time", "tr", "tt", "u", "ul", "var", "wbr",
+]
+
+# elements dropped by the sanitizer together with their content
+DroppedElements = [
+    "script", "style", "noscript", "template", "iframe", "frame", "frameset", "object",
+    "embed", "applet", "base", "link", "meta", "form", "input", "button", "select",
+    "textarea", "option", "audio", "video", "source", "track", "canvas", "svg", "math",
+]
+
+# attributes kept by the sanitizer
+SafeAttributes = [
+    "align", "alt", "border", "cellpadding", "cellspacing", "cite", "class", "color",
+    "cols", "colspan", "datetime", "dir", "face", "headers", "height", "href", "id",
+    "lang", "open", "reversed", "rows", "rowspan", "scope", "size", "span", "src",
+    "start", "title", "type", "valign", "width",
+]
+
+# schemes allowed in the URL attributes, relative URLs are allowed too;
+# src may also hold an inline raster image
+UrlSchemes = {
+    "href": ["http", "https", "mailto"],
+    "src": ["http", "https"],
+    "cite": ["http", "https"],
+}
+
+SanitizeSource = """
+(function(safeElements, droppedElements, safeAttributes, urlSchemes) {
+    var xhtml = "http://www.w3.org/1999/xhtml";
+    function safeUrl(name, value) {
+        // the URL parser drops whitespace and control characters
+        value = value.replace(/[\\s\\u0000-\\u001f]+/g, "").toLowerCase();
+        var scheme = /^([a-z][a-z0-9+.\\-]*):/.exec(value);
+        if (!scheme)
+            return true;
+        if (name === "src" && /^data:image\\/(png|gif|jpeg|webp)[;,]/.test(value))
+            return true;
+        return urlSchemes[name].indexOf(scheme[1]) >= 0;
+    }
+    // a copy, the live collection changes while elements are removed
+    var elements = Array.prototype.slice.call(document.getElementsByTagName("*"));
+    for (var i = 0; i < elements.length; i++) {
+        var element = elements[i], parent = element.parentNode;
+        var name = element.localName;
+        if (!document.documentElement.contains(element))
+            continue;
+        if (element.namespaceURI !== xhtml || droppedElements.indexOf(name) >= 0) {
+            parent.removeChild(element);
+            continue;
+        }
+        if (safeElements.indexOf(name) < 0) {
+            while (element.firstChild)
+                parent.insertBefore(element.firstChild, element);
+            parent.removeChild(element);
+            continue;
+        }
+        var attributes = element.attributes;
+        for (var j = attributes.length - 1; j >= 0; j--) {
+            var attribute = attributes[j].name.toLowerCase();
+            if (safeAttributes.indexOf(attribute) < 0 || (attribute in urlSchemes &&
+                    !safeUrl(attribute, attributes[j].value)))
+                element.removeAttribute(attributes[j].name);
+        }
+    }
+    return true;
+})(%s, %s, %s, %s);
+""" % (json.dumps(SafeElements), json.dumps(DroppedElements), json.dumps(SafeAttributes),
+        json.dumps(UrlSchemes))
+
+ContentTypes = {renderservice.Pdf: "application/pdf", renderservice.Thumbnail: "image/png"}
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class PageTask(object):
+
+    def __init__(self, html, script, future, pool):
+        self.html = html
+        self.script = script
+        self.future = future
+        self.pool = pool
+        self.page = None
+        self.timer = None
+        self.loadSlot = None
+        self.done = False
+
+
+class EditingService(QtCore.QObject):
+    """
+    Run requests of other threads on pooled pages in the GUI thread
+
+    call() may be used from any thread, it returns a
+    concurrent.futures.Future resolved in the GUI thread with a dict
+    for JSON results or (contentType, bytes) for renderings.
+
+    The documents come from clients, every endpoint loads them into the
+    pages of a sandboxPool(), the renderer has to use the same pool.
+    """
+
+    submitted = QtCore.pyqtSignal(object)
+
+    def __init__(self, pool=None, renderer=None, timeout=RequestTimeout, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.pool = pool or sandboxPool(MaxPages, self)
+        self.renderer = renderer or renderservice.RenderService(self.pool,
+                concurrency=self.pool.maxPages, timeout=timeout, parent=self)
+        self.timeout = timeout
+        self.handlers = {
+            "normalize": self.normalize,
+            "sanitize": self.sanitize,
+            "render": self.render,
+        }
+        # submitted by a request thread, not yet taken by the GUI thread
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.renderings = {}
+        self.renderer.finished.connect(self.rendered)
+        # emitted from request threads, delivered queued
+        self.submitted.connect(self.dispatch)
+
+    def call(self, name, params):
+        future = concurrent.futures.Future()
+        with self.lock:
+            self.pending += 1
+        self.submitted.emit((name, params, future))
+        return future
+
+    def queueDepth(self):
+        return self.pending + len(self.pool.waiting) + self.renderer.queueDepth()
+
+    def dispatch(self, request):
+        name, params, future = request
+        with self.lock:
+            self.pending -= 1
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            self.handlers[name](params, future)
+        except Exception as e:
+            future.set_exception(e)
+
+    def normalize(self, params, future):
+        options = {
+            "commands": [tuple(pair) for pair in params.get("commands", [])],
+            "links": [tuple(pair) for pair in params.get("links", [])],
+            "inlineImages": False,
+        }
+        self.runScript(params["html"], batch.normalizeScript(options), future)
+
+    def sanitize(self, params, future):
+        self.runScript(params["html"], SanitizeSource, future)
+
+    def render(self, params, future):
+        kind = params.get("kind", renderservice.Pdf)
+        if kind not in ContentTypes:
+            raise ValueError("unknown kind: %s" % kind)
+        options = {}
+        if kind == renderservice.Thumbnail:
+            options["width"] = int(params.get("width", renderservice.ThumbnailWidth))
+        job = self.renderer.render(kind, params["html"], **options)
+        if job is None:
+            raise ServiceBusy("render queue is full")
+        self.renderings[job] = (kind, future)
+
+    def rendered(self, job, data, error):
+        if job not in self.renderings:
+            return
+        kind, future = self.renderings.pop(job)
+        if error:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result((ContentTypes[kind], data))
+
+    def runScript(self, html, script, future):
+        if len(html.encode("utf-8")) >= renderservice.SetHtmlLimit:
+            raise ValueError("document too large")
+        task = PageTask(html, script, future, self.pool)
+        task.pool.acquire(lambda page: self.startTask(task, page))
+
+    def startTask(self, task, page):
+        task.page = page
+        task.timer = QtCore.QTimer(self)
+        task.timer.setSingleShot(True)
+        task.timer.timeout.connect(lambda: self.finishTask(task, error="timed out"))
+        task.timer.start(self.timeout)
+        task.loadSlot = lambda ok: self.taskLoaded(task, ok)
+        page.loadFinished.connect(task.loadSlot)
+        page.setHtml(task.html)
+
+    def taskLoaded(self, task, ok):
+        if task.done:
+            return
+        if not ok:
+            self.finishTask(task, error="load failed")
+            return
+        task.page.runJavaScript(task.script, jsruntime.WorldId,
+                lambda result: self.serializeTask(task))
+
+    def serializeTask(self, task):
+        if not task.done:
+            task.page.toHtml(lambda html: self.finishTask(task, html))
+
+    def finishTask(self, task, html=None, error=""):
+        if task.done:
+            return
+        task.done = True
+        task.timer.stop()
+        task.timer.deleteLater()
+        task.page.loadFinished.disconnect(task.loadSlot)
+        task.pool.release(task.page)
+        task.page = None
+        if error:
+            task.future.set_exception(RuntimeError(error))
+        else:
+            task.future.set_result({"html": html})
+
+
+class Metrics(object):
+    """Request counts and latencies per endpoint, shared by the request threads"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.requests = collections.Counter()
+        self.errors = collections.Counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=LatencyWindow))
+        self.inFlight = 0
+
+    def begin(self):
+        with self.lock:
+            self.inFlight += 1
+
+    def end(self, endpoint, seconds, ok):
+        with self.lock:
+            self.inFlight -= 1
+            self.requests[endpoint] += 1
+            if not ok:
+                self.errors[endpoint] += 1
+            self.latencies[endpoint].append(seconds)
+
+    def snapshot(self):
+        with self.lock:
+            endpoints = {}
+            for endpoint, latencies in self.latencies.items():
+                endpoints[endpoint] = {
+                    "requests": self.requests[endpoint],
+                    "errors": self.errors[endpoint],
+                    "p50_ms": percentile(latencies, 0.50) * 1e3,
+                    "p90_ms": percentile(latencies, 0.90) * 1e3,
+                    "p99_ms": percentile(latencies, 0.99) * 1e3,
+                    "max_ms": max(latencies) * 1e3,
+                }
+            return {
+                "uptime_s": time.time() - self.started,
+                "in_flight": self.inFlight,
+                "endpoints": endpoints,
+            }
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+
+    # keep-alive, pipelined requests are answered in order
+    protocol_version = "HTTP/1.1"
+    server_version = "pyhtmleditor"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def sendBody(self, status, contentType, body, close=False):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        if close:
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendJson(self, status, value, close=False):
+        self.sendBody(status, "application/json", json.dumps(value).encode("utf-8"), close)
+
+    def contentLength(self):
+        """
+        Return the length of the request body, or None once refused
+
+        Without a valid length the next request cannot be found, the
+        connection is closed after the error.
+        """
+        value = self.headers.get("Content-Length")
+        if value is None:
+            self.sendJson(411, {"error": "Content-Length required"}, close=True)
+            return None
+        try:
+            length = int(value)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.sendJson(400, {"error": "invalid Content-Length"}, close=True)
+            return None
+        if length > self.server.maxRequestSize:
+            self.sendJson(413, {"error": "request too large"}, close=True)
+            return None
+        return length
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            metrics = self.server.metrics.snapshot()
+            pool = self.server.service.pool
+            metrics.update({
+                "queue_depth": self.server.service.queueDepth(),
+                "pages": pool.size(),
+                "pages_created": pool.created,
+                "pages_reused": pool.reused,
+                "pages_hung": pool.hung,
+                "render_cache_hits": self.server.service.renderer.hits,
+                "render_cache_misses": self.server.service.renderer.misses,
+            })
+            self.sendJson(200, metrics)
+        elif self.path == "/health":
+            self.sendJson(200, {"ok": True})
+        else:
+            self.sendJson(404, {"error": "not found"})
+
+    def do_POST(self):
+        # the body is read in any case, the next request follows it
+        length = self.contentLength()
+        if length is None:
+            return
+        body = self.rfile.read(length)
+        endpoint = self.path.strip("/")
+        if endpoint not in self.server.service.handlers:
+            self.sendJson(404, {"error": "not found"})
+            return
+
+        metrics = self.server.metrics
+        metrics.begin()
+        start = time.perf_counter()
+        status = 200
+        try:
+            params = json.loads(body.decode("utf-8"))
+            if not isinstance(params, dict) or not isinstance(params.get("html"), str):
+                raise ValueError("expected a JSON object with an html string")
+            result = self.server.service.call(endpoint, params).result(self.server.requestTimeout)
+        except (ValueError, KeyError, TypeError) as e:
+            status, result = 400, {"error": str(e)}
+        except ServiceBusy as e:
+            status, result = 503, {"error": str(e)}
+        except concurrent.futures.TimeoutError:
+            status, result = 504, {"error": "timed out"}
+        except Exception as e:
+            status, result = 500, {"error": str(e)}
+        metrics.end(endpoint, time.perf_counter() - start, status == 200)
+
+        if isinstance(result, tuple):
+            self.sendBody(status, result[0], result[1])
+        else:
+            self.sendJson(status, result)
+
+
+def createServer(service, host="127.0.0.1", port=Port, timeout=RequestTimeout, verbose=False):
+    """
+    Return a server answering requests with service, not yet serving
+
+    :param service: The EditingService
+    :param host: Address to listen on. Defaults to 127.0.0.1
+    :param port: Port, 0 picks a free one. Defaults to Port
+    :param timeout: Milliseconds per request. Defaults to RequestTimeout
+    :param verbose: Whether every request is logged. Defaults to False
+    """
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.metrics = Metrics()
+    server.verbose = verbose
+    server.maxRequestSize = MaxRequestSize
+    # a little longer than the editor, so its own timeout is reported
+    server.requestTimeout = timeout / 1000.0 + 1
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="pyhtmleditor --serve",
+            description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=Port, help="port, 0 picks a free one")
+    parser.add_argument("--pages", type=int, default=MaxPages, help="pages serving requests")
+    parser.add_argument("--queue", type=int, default=renderservice.MaxQueue,
+            help="renderings waiting before requests are refused")
+    parser.add_argument("--timeout", type=int, default=RequestTimeout,
+            help="milliseconds per request")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    schemehandler.registerScheme()
+    app = QtWidgets.QApplication(sys.argv[:1])
+
+    pool = sandboxPool(args.pages, app, minPages=args.pages)
+    pool.warm()
+    renderer = renderservice.RenderService(pool, concurrency=args.pages,
+            maxQueue=args.queue, timeout=args.timeout, parent=app)
+    service = EditingService(pool, renderer, args.timeout, parent=app)
+
+    server = createServer(service, args.host, args.port, args.timeout, args.verbose)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print("serving on http://%s:%d" % server.server_address[:2])
+    sys.stdout.flush()
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    status = app.exec_()
+    server.shutdown()
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+import itertools
+import multiprocessing
+import concurrent.futures
+
+from PyQt5 import QtCore, QtGui
+
+# CSS pixels an inserted image is displayed at, at most
+DisplayWidth = 800
+
+# device pixel ratios a variant is produced for, listed in the srcset
+Scales = (1, 2)
+
+# JPEG quality of the re-encoded variants
+Quality = 85
+
+# images at most this much wider than DisplayWidth are inserted as is
+Slack = 1.25
+
+
+def imageSize(fileName):
+    """Return the QSize of the image in fileName, reading only its header"""
+    return QtGui.QImageReader(fileName).size()
+
+
+def needsScaling(fileName, width=DisplayWidth):
+    size = imageSize(fileName)
+    return size.isValid() and size.width() > width * Slack
+
+
+def displaySize(size, width=DisplayWidth):
+    if size.width() <= width:
+        return size
+    return QtCore.QSize(width, max(1, round(size.height() * width / size.width())))
+
+
+def scaleImage(fileName, store, width=DisplayWidth, scales=Scales, quality=Quality):
+    """
+    Produce the display variants of an image and add them to store
+
+    Runs in a worker process, so it only takes and returns plain values.
+    Returns a list of (path, scale) of the variants, smallest first. A
+    variant is not produced when the image is too small for its scale.
+
+    :param fileName: Path of the image
+    :param store: The AssetStore for the variants
+    :param width: Display width in CSS pixels. Defaults to DisplayWidth
+    :param scales: Device pixel ratios. Defaults to Scales
+    :param quality: JPEG quality. Defaults to Quality
+    """
+    reader = QtGui.QImageReader(fileName)
+    # rotate photos according to their EXIF orientation
+    reader.setAutoTransform(True)
+    image = reader.read()
+    if image.isNull():
+        raise ValueError("cannot read %s: %s" % (fileName, reader.errorString()))
+
+    # keep transparency, everything else becomes a JPEG
+    extension = ".png" if image.hasAlphaChannel() else ".jpg"
+    variants = []
+    for scale in sorted(scales):
+        target = width * scale
+        if variants and target > image.width():
+            break
+        scaled = image
+        if target < image.width():
+            scaled = image.scaledToWidth(target, QtCore.Qt.SmoothTransformation)
+        fd, tmpName = tempfile.mkstemp(suffix=extension)
+        os.close(fd)
+        try:
+            if not scaled.save(tmpName, None, quality if extension == ".jpg" else -1):
+                raise ValueError("cannot write %s" % tmpName)
+            variants.append((store.add(tmpName), scale))
+        finally:
+            os.unlink(tmpName)
+    return variants
+
+
+class ImageSignals(QtCore.QObject):
+    finished = QtCore.pyqtSignal(int, object, str)
+
+
+class ImagePipeline(QtCore.QObject):
+    """
+    Downscale and re-encode inserted images in worker processes
+
+    process() returns a job id right away, decoding and encoding happen
+    in a process pool so neither the GUI nor the other threads wait on
+    them. finished(job, variants, error) is emitted in the GUI thread,
+    variants being the list returned by scaleImage.
+    """
+
+    finished = QtCore.pyqtSignal(int, object, str)
+
+    def __init__(self, parent=None, workers=None):
+        QtCore.QObject.__init__(self, parent)
+        self.workers = workers
+        self.executor = None
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        # emitted from the executor thread, delivered queued
+        self.signals = ImageSignals(self)
+        self.signals.finished.connect(self.jobFinished)
+
+    def process(self, fileName, store, width=DisplayWidth):
+        if self.executor is None:
+            # a forked Qt process is not safe to use, start fresh interpreters
+            self.executor = concurrent.futures.ProcessPoolExecutor(self.workers,
+                    mp_context=multiprocessing.get_context("spawn"))
+        job = next(self.ids)
+        future = self.executor.submit(scaleImage, fileName, store, width)
+        self.jobs[job] = future
+        future.add_done_callback(lambda future: self.done(job, future))
+        return job
+
+    def done(self, job, future):
+        if future.cancelled():
+            return
+        try:
+            variants = future.result()
+        except Exception as e:
+            self.signals.finished.emit(job, None, str(e))
+        else:
+            self.signals.finished.emit(job, variants, "")
+
+    def jobFinished(self, job, variants, error):
+        if self.jobs.pop(job, None) is not None:
+            self.finished.emit(job, variants, error)
+
+    def pending(self):
+        return len(self.jobs)
+
+    def shutdown(self):
+        """Drop the pending jobs and stop the worker processes"""
+        for future in self.jobs.values():
+            future.cancel()
+        self.jobs.clear()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import zlib
+import struct
+
+from PyQt5 import QtCore
+
+from pyhtmleditor import sourcetext
+from pyhtmleditor.saver import writeAtomic
+
+Magic = b"PYHTMLEDITOR-JOURNAL 1\n"
+
+# record types
+Snapshot = 1
+Patch = 2
+
+# record header: type, payload length, crc32 of the payload
+_header = struct.Struct(">BII")
+
+# patches appended before the journal is compacted into one snapshot
+MaxPatches = 500
+
+# milliseconds between a change and the journal record written for it
+AutosaveInterval = 5000
+
+
+def journalPath(fileName):
+    directory, name = os.path.split(os.path.abspath(fileName))
+    return os.path.join(directory, "." + name + ".journal")
+
+
+def _record(kind, payload):
+    payload = zlib.compress(payload.encode("utf-8"), 1)
+    return _header.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+
+class Journal(object):
+    """
+    Append-only journal of the states of one document
+
+    The journal starts with a compressed snapshot of the document, each
+    later state is appended as a compressed patch of the lines that
+    changed since the previous one. Records are checksummed, so a
+    record torn by a crash is ignored on replay.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lines = None
+        self.patches = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, text):
+        lines = sourcetext.splitLines(text)
+        if self.lines is None or self.patches >= MaxPatches:
+            self.compact(text, lines)
+            return
+
+        diff = sourcetext.diffLines(self.lines, lines)
+        if diff is None:
+            return
+        start, oldEnd, newEnd = diff
+        payload = json.dumps([start, oldEnd, lines[start:newEnd]])
+        with open(self.path, "ab") as fd:
+            fd.write(_record(Patch, payload))
+            fd.flush()
+            os.fsync(fd.fileno())
+        self.lines = lines
+        self.patches += 1
+
+    def compact(self, text, lines=None):
+        writeAtomic(self.path, Magic + _record(Snapshot, text))
+        self.lines = lines if lines is not None else sourcetext.splitLines(text)
+        self.patches = 0
+
+    def replay(self):
+        """Return the last complete state recorded, or None"""
+        try:
+            with open(self.path, "rb") as fd:
+                data = fd.read()
+        except (IOError, OSError):
+            return None
+        if not data.startswith(Magic):
+            return None
+
+        lines = None
+        pos = len(Magic)
+        while pos + _header.size <= len(data):
+            kind, length, crc = _header.unpack_from(data, pos)
+            payload = data[pos + _header.size:pos + _header.size + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                break
+            pos += _header.size + length
+            payload = zlib.decompress(payload).decode("utf-8")
+            if kind == Snapshot:
+                lines = sourcetext.splitLines(payload)
+            elif kind == Patch and lines is not None:
+                start, end, new = json.loads(payload)
+                lines[start:end] = new
+        if lines is None:
+            return None
+        return "\n".join(lines)
+
+    def discard(self):
+        self.lines = None
+        self.patches = 0
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class JournalSignals(QtCore.QObject):
+    failed = QtCore.pyqtSignal(str)
+
+
+class JournalJob(QtCore.QRunnable):
+
+    def __init__(self, journal, html, signals):
+        QtCore.QRunnable.__init__(self)
+        self.journal = journal
+        self.html = html
+        self.signals = signals
+
+    def run(self):
+        try:
+            self.journal.append(self.html)
+        except Exception as e:
+            self.signals.failed.emit(str(e) or type(e).__name__)
+
+
+class Autosaver(QtCore.QObject):
+    """
+    Record the document of a page in a journal next to its file
+
+    schedule() is called whenever the document is modified, the journal
+    is written AutosaveInterval milliseconds later on a worker thread,
+    so bursts of edits result in a single small record. Errors writing
+    the journal are reported with the failed signal.
+    """
+
+    failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, page, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.page = page
+        # the journal keeps the last state before the renderer died
+        page.renderProcessTerminated.connect(self.renderProcessTerminated)
+        self.signals = JournalSignals(self)
+        self.signals.failed.connect(self.failed)
+        self.journal = None
+        # bumped on discard, autosaves started before are dropped
+        self.generation = 0
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(AutosaveInterval)
+        self.timer.timeout.connect(self.autosave)
+
+    def setFileName(self, fileName):
+        """Journal the document of fileName, the previous journal is dropped"""
+        path = journalPath(fileName) if fileName and not fileName.startswith(":/") else None
+        if self.journal is not None and self.journal.path == path:
+            return
+        self.discard()
+        self.journal = Journal(path) if path else None
+
+    def recover(self):
+        """Return the text recorded for the current file, or None"""
+        if self.journal is None or not self.journal.exists():
+            return None
+        fileName = os.path.join(os.path.dirname(self.journal.path),
+                os.path.basename(self.journal.path)[1:-len(".journal")])
+        if os.path.exists(fileName) and os.path.getmtime(fileName) > os.path.getmtime(self.journal.path):
+            # the file was written after the journal, it is stale
+            return None
+        return self.journal.replay()
+
+    def schedule(self):
+        if self.journal is not None and not self.timer.isActive():
+            self.timer.start()
+
+    def autosave(self):
+        journal = self.journal
+        generation = self.generation
+        if journal is not None:
+            self.page.toHtml(lambda html: self.write(journal, generation, html))
+
+    def write(self, journal, generation, html):
+        # an empty result comes from a page that is gone or not loaded
+        if html and journal is self.journal and generation == self.generation:
+            self.pool.start(JournalJob(journal, html, self.signals))
+
+    def renderProcessTerminated(self, status, exitCode):
+        self.generation += 1
+        self.timer.stop()
+
+    def discard(self):
+        self.generation += 1
+        self.timer.stop()
+        self.pool.waitForDone()
+        if self.journal is not None:
+            self.journal.discard()
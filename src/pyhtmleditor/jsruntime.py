@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+
+from PyQt5 import QtCore, QtWebEngineWidgets
+
+# editing commands known to the runtime, the index is the command id
+Commands = [
+    "bold", "italic", "underline", "strikeThrough",
+    "justifyLeft", "justifyCenter", "justifyRight", "justifyFull",
+    "indent", "outdent", "insertOrderedList", "insertUnorderedList",
+    "formatBlock", "fontName", "fontSize", "foreColor", "hiliteColor",
+    "createLink", "insertImage", "insertHTML",
+]
+
+CommandIds = dict((cmd, i) for i, cmd in enumerate(Commands))
+
+ScriptName = "pyhtmleditor-runtime"
+
+# the runtime and the web channel live in their own world, so scripts
+# in the edited page can neither see nor clobber them
+WorldId = QtWebEngineWidgets.QWebEngineScript.ApplicationWorld
+
+# name of the editor object registered on the web channel
+ChannelObject = "MyChannel"
+
+# milliseconds to collect mutation records before sending them
+MutationDelay = 50
+
+RuntimeSource = """
+(function() {
+    if (window.pyhtmleditor)
+        return;
+    var commands = %(commands)s;
+    var editor = null;
+    var changes = [];
+    var flushTimer = null;
+    var observer = null;
+    var types = {childList: "l", characterData: "t", attributes: "a"};
+
+    function name(id) {
+        return typeof id === "number" ? commands[id] : id;
+    }
+
+    // child index path from document.body down to node, null outside of
+    // the body; the indices of a parent's children are looked up once per
+    // batch in indices, so long sibling lists are walked only once
+    function path(node, indices) {
+        var p = [];
+        while (node && node !== document.body) {
+            var parent = node.parentNode;
+            if (!parent)
+                return null;
+            if (!indices.has(node)) {
+                var children = parent.childNodes;
+                for (var i = 0; i < children.length; i++)
+                    indices.set(children[i], i);
+            }
+            p.push(indices.get(node));
+            node = parent;
+        }
+        return node ? p.reverse() : null;
+    }
+
+    function flush() {
+        flushTimer = null;
+        if (editor && changes.length)
+            editor.js_mutations(JSON.stringify(changes));
+        changes = [];
+    }
+
+    function record(mutations) {
+        var seen = {};
+        var indices = new Map();
+        for (var i = 0; i < mutations.length; i++) {
+            var m = mutations[i];
+            // edits of removed nodes, their removal is recorded already
+            if (!document.documentElement.contains(m.target))
+                continue;
+            var c = {t: types[m.type], p: path(m.target, indices)};
+            if (m.type === "attributes")
+                c.a = m.attributeName;
+            else if (m.type === "childList") {
+                c.n = m.addedNodes.length;
+                c.r = m.removedNodes.length;
+            }
+            var key = c.t + (c.p ? c.p.join(".") : "-") + (c.a || "");
+            if (c.t !== "l" && seen[key])
+                continue;
+            seen[key] = true;
+            changes.push(c);
+        }
+        if (flushTimer === null)
+            flushTimer = setTimeout(flush, %(delay)d);
+    }
+
+    function caret() {
+        if (editor)
+            editor.js_new_pos("caret");
+    }
+
+    function start() {
+        // pages without a web channel, e.g. in batch mode
+        if (typeof qt === "undefined" || !qt.webChannelTransport)
+            return;
+        new QWebChannel(qt.webChannelTransport, function(channel) {
+            editor = channel.objects.%(object)s;
+            observer = new MutationObserver(record);
+            observer.observe(document.documentElement, {
+                childList: true, subtree: true, attributes: true,
+                characterData: true
+            });
+            document.addEventListener("keyup", caret, true);
+            document.addEventListener("mouseup", caret, true);
+        });
+    }
+
+    if (document.readyState === "loading")
+        document.addEventListener("DOMContentLoaded", start);
+    else
+        start();
+
+    function escapeText(text) {
+        return text.replace(/&/g, "&amp;").replace(/\u00a0/g, "&nbsp;")
+                .replace(/</g, "&lt;").replace(/>/g, "&gt;");
+    }
+
+    function outer(node) {
+        if (node.nodeType === Node.ELEMENT_NODE)
+            return node.outerHTML;
+        if (node.nodeType === Node.TEXT_NODE)
+            return escapeText(node.data);
+        if (node.nodeType === Node.COMMENT_NODE)
+            return "<!--" + node.data + "-->";
+        return "";
+    }
+
+    function openTag(element) {
+        var html = element.cloneNode(false).outerHTML;
+        return html.substring(0, html.length - element.localName.length - 3);
+    }
+
+    function doctype() {
+        var d = document.doctype;
+        if (!d)
+            return "";
+        var id = "";
+        if (d.publicId)
+            id += ' PUBLIC "' + d.publicId + '"';
+        if (d.systemId)
+            id += (d.publicId ? ' "' : ' SYSTEM "') + d.systemId + '"';
+        return "<!DOCTYPE " + d.name + id + ">";
+    }
+
+    function mapSrcset(srcset, urls) {
+        return srcset.split(",").map(function(candidate) {
+            var parts = candidate.trim().split(/\\s+/);
+            if (urls.hasOwnProperty(parts[0]))
+                parts[0] = urls[parts[0]];
+            return parts.join(" ");
+        }).join(", ");
+    }
+
+    window.pyhtmleditor = {
+        exec: function(id, arg) {
+            return document.execCommand(name(id), false,
+                    arg === undefined ? null : arg);
+        },
+        states: function(ids) {
+            var states = {};
+            for (var i = 0; i < ids.length; i++) {
+                var cmd = name(ids[i]);
+                states[cmd] = document.queryCommandState(cmd);
+            }
+            return JSON.stringify(states);
+        },
+        setImage: function(original, src, srcset) {
+            // every copy of the original, also those undone and redone
+            // or pasted while it was processed
+            var count = 0;
+            for (var i = 0; i < document.images.length; i++) {
+                var img = document.images[i];
+                if (img.getAttribute("src") !== original || img.hasAttribute("srcset"))
+                    continue;
+                img.setAttribute("src", src);
+                if (srcset)
+                    img.setAttribute("srcset", srcset);
+                count++;
+            }
+            return count;
+        },
+        images: function() {
+            var urls = [];
+            for (var i = 0; i < document.images.length; i++) {
+                var img = document.images[i];
+                if (img.hasAttribute("src"))
+                    urls.push(img.getAttribute("src"));
+                var srcset = img.getAttribute("srcset");
+                if (srcset)
+                    srcset.split(",").forEach(function(candidate) {
+                        urls.push(candidate.trim().split(/\\s+/)[0]);
+                    });
+            }
+            return JSON.stringify(urls);
+        },
+        serialize: function(first, last) {
+            // the source of the body children first to last, -1 meaning
+            // to the end, and of the document around the body children
+            if (observer)
+                record(observer.takeRecords());
+            if (flushTimer !== null) {
+                clearTimeout(flushTimer);
+                flush();
+            }
+            var root = document.documentElement;
+            var body = document.body;
+            var head = doctype() + openTag(root);
+            var tail = "";
+            for (var n = root.firstChild; n && n !== body; n = n.nextSibling)
+                head += outer(n);
+            if (body) {
+                head += openTag(body);
+                tail = "</body>";
+                for (n = body.nextSibling; n; n = n.nextSibling)
+                    tail += outer(n);
+            }
+            tail += "</" + root.localName + ">";
+            var children = body ? body.childNodes : [];
+            if (last < 0 || last >= children.length)
+                last = children.length - 1;
+            var parts = [];
+            for (var i = first; i <= last; i++)
+                parts.push(outer(children[i]));
+            return JSON.stringify({head: head, tail: tail, first: first,
+                    count: children.length, parts: parts});
+        },
+        relocate: function(urls) {
+            // moving the images along with the document is no edit, the
+            // records of the edits before are still sent
+            if (observer)
+                record(observer.takeRecords());
+            for (var i = 0; i < document.images.length; i++) {
+                var img = document.images[i];
+                var src = img.getAttribute("src");
+                if (src !== null && urls.hasOwnProperty(src))
+                    img.setAttribute("src", urls[src]);
+                var srcset = img.getAttribute("srcset");
+                if (srcset)
+                    img.setAttribute("srcset", mapSrcset(srcset, urls));
+            }
+            if (observer)
+                observer.takeRecords();
+            return true;
+        }
+    };
+})();
+"""
+
+
+def channelSource():
+    fd = QtCore.QFile(":/qtwebchannel/qwebchannel.js")
+    if not fd.open(QtCore.QIODevice.ReadOnly):
+        return ""
+    source = bytes(fd.readAll()).decode("utf-8")
+    fd.close()
+    return source
+
+
+def commandId(cmd):
+    return CommandIds.get(cmd, cmd)
+
+
+def execCall(cmd, arg=None):
+    """
+    Build the call dispatching an editing command to the runtime
+
+    :param cmd: Command name, e.g. "bold"
+    :param arg: Command argument, passed through as JSON. Defaults to None
+    """
+    if arg is None:
+        return "pyhtmleditor.exec({0});".format(json.dumps(commandId(cmd)))
+    return "pyhtmleditor.exec({0},{1});".format(
+            json.dumps(commandId(cmd)), json.dumps(arg))
+
+
+def statesCall(cmds):
+    ids = [commandId(cmd) for cmd in cmds]
+    return "pyhtmleditor.states({0});".format(json.dumps(ids, separators=(',', ':')))
+
+
+def setImageCall(original, src, srcset=None):
+    """
+    Build the call replacing an image shown until its variants are ready
+
+    :param original: The src of the image as inserted
+    :param src: The new src
+    :param srcset: The new srcset. Defaults to None
+    """
+    return "pyhtmleditor.setImage({0},{1},{2});".format(
+            json.dumps(original), json.dumps(src), json.dumps(srcset or ""))
+
+
+def imagesCall():
+    return "pyhtmleditor.images();"
+
+
+def relocateCall(urls):
+    """
+    Build the call replacing image URLs in src and srcset attributes
+
+    :param urls: dict mapping the old URLs to the new ones
+    """
+    return "pyhtmleditor.relocate({0});".format(json.dumps(urls))
+
+
+def serializeCall(first=0, last=None):
+    """
+    Build the call serializing the document split at the body children
+
+    :param first: Index of the first body child to serialize. Defaults to 0
+    :param last: Index of the last one, None meaning to the end. Defaults
+        to None
+    """
+    return "pyhtmleditor.serialize({0},{1});".format(
+            int(first), -1 if last is None else int(last))
+
+
+def createScript():
+    script = QtWebEngineWidgets.QWebEngineScript()
+    script.setName(ScriptName)
+    runtime = RuntimeSource % {"commands": json.dumps(Commands),
+                        "delay": MutationDelay,
+                        "object": ChannelObject}
+    script.setSourceCode(channelSource() + runtime)
+    script.setInjectionPoint(QtWebEngineWidgets.QWebEngineScript.DocumentCreation)
+    script.setWorldId(WorldId)
+    script.setRunsOnSubFrames(False)
+    return script
+
+
+def install(page, channel=None):
+    """
+    Inject the editing runtime into every document loaded by page
+
+    :param page: The QWebEnginePage
+    :param channel: QWebChannel with the editor registered as
+        ChannelObject, used to report mutations. Defaults to None
+    """
+    if channel is not None:
+        page.setWebChannel(channel, WorldId)
+    scripts = page.scripts()
+    if scripts.findScript(ScriptName).isNull():
+        scripts.insert(createScript())
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import collections
+
+from PyQt5 import QtCore, QtWebEngineCore, QtWebEngineWidgets
+
+from pyhtmleditor import jsruntime, schemehandler
+
+# live pages, each may keep a renderer process busy
+MaxPages = 4
+
+# milliseconds an unused page is kept before it is deleted
+IdleTimeout = 60000
+
+# milliseconds a released page may take to load the blank page before it
+# is deleted and replaced
+ResetTimeout = 10000
+
+# schemes the pages of a sandbox pool may request by default, everything
+# else is blocked
+SandboxSchemes = ("data", "about")
+
+
+class PagePool(QtCore.QObject):
+    """
+    Hand out warmed QWebEnginePages sharing one profile
+
+    acquire(callback) calls back with a page as soon as one is free.
+    At most maxPages pages are alive, further requests wait for a
+    release(). Released pages are reset and kept for reuse, pages left
+    unused for idleTimeout milliseconds are deleted, except for the
+    minPages most recently used ones. A page not reset within
+    resetTimeout milliseconds is deleted and replaced.
+
+    Users disconnect the slots they connected to a page before they
+    release it, the pool only drops its own.
+    """
+
+    def __init__(self, maxPages=MaxPages, minPages=0, idleTimeout=IdleTimeout,
+            profile=None, parent=None, resetTimeout=ResetTimeout):
+        QtCore.QObject.__init__(self, parent)
+        self.maxPages = maxPages
+        self.minPages = minPages
+        self.idleTimeout = idleTimeout
+        self.resetTimeout = resetTimeout
+        # off the record unless given, no cache or cookies leak into the disk
+        self.profile = profile or QtWebEngineWidgets.QWebEngineProfile(self)
+        self.schemeHandler = schemehandler.install(self.profile)
+        self.idle = collections.deque()
+        self.busy = set()
+        # resetting page to its loadFinished slot and timer
+        self.resetting = {}
+        self.crashed = set()
+        self.waiting = collections.deque()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+        self.hung = 0
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(max(1000, idleTimeout // 2))
+        self.timer.timeout.connect(self.evictIdle)
+        self.timer.start()
+
+    def size(self):
+        return len(self.idle) + len(self.busy) + len(self.resetting)
+
+    def warm(self, count=None):
+        """Create pages up front, up to count or minPages"""
+        count = min(self.maxPages, self.minPages if count is None else count)
+        while self.size() < count:
+            self.idle.append((self.createPage(), time.monotonic()))
+
+    def createPage(self):
+        page = QtWebEngineWidgets.QWebEnginePage(self.profile, self)
+        jsruntime.install(page)
+        page.renderProcessTerminated.connect(
+                lambda status, code, page=page: self.crashed.add(page))
+        self.created += 1
+        return page
+
+    def acquire(self, callback):
+        """
+        Call callback with a page, now or once one is released
+
+        :param callback: Called with the page, which has to be given
+            back with release()
+        """
+        while self.idle and self.idle[-1][0] in self.crashed:
+            self.discard(self.idle.pop()[0])
+        if self.idle:
+            page = self.idle.pop()[0]
+            self.reused += 1
+        elif self.size() < self.maxPages:
+            page = self.createPage()
+        else:
+            self.waiting.append(callback)
+            return
+        self.busy.add(page)
+        callback(page)
+
+    def release(self, page):
+        self.busy.discard(page)
+        if page in self.crashed:
+            self.discard(page)
+            self.serveWaiting()
+        else:
+            self.reset(page)
+
+    def reset(self, page):
+        # drop what the last user loaded and changed
+        page.triggerAction(QtWebEngineWidgets.QWebEnginePage.Stop)
+        page.setZoomFactor(1.0)
+        # reused once the blank page is in, so no late load signal of
+        # the previous user reaches the next one
+        slot = lambda ok, page=page: self.recycled(page)
+        timer = QtCore.QTimer(self)
+        timer.setSingleShot(True)
+        timer.timeout.connect(lambda page=page: self.resetTimedOut(page))
+        self.resetting[page] = (slot, timer)
+        page.loadFinished.connect(slot)
+        timer.start(self.resetTimeout)
+        page.setUrl(QtCore.QUrl("about:blank"))
+
+    def endReset(self, page):
+        slot, timer = self.resetting.pop(page)
+        page.loadFinished.disconnect(slot)
+        timer.stop()
+        timer.deleteLater()
+
+    def recycled(self, page):
+        if page not in self.resetting:
+            return
+        self.endReset(page)
+        if page in self.crashed:
+            self.discard(page)
+        else:
+            page.history().clear()
+            self.idle.append((page, time.monotonic()))
+        self.serveWaiting()
+
+    def resetTimedOut(self, page):
+        if page not in self.resetting:
+            return
+        self.endReset(page)
+        self.discard(page)
+        self.hung += 1
+        # a fresh page takes its place
+        self.warm()
+        self.serveWaiting()
+
+    def serveWaiting(self):
+        if self.waiting:
+            self.acquire(self.waiting.popleft())
+
+    def evictIdle(self):
+        deadline = time.monotonic() - self.idleTimeout / 1000.0
+        keep = max(0, self.minPages - len(self.busy))
+        # the least recently used pages are at the left
+        while len(self.idle) > keep and (self.idle[0][1] < deadline or self.idle[0][0] in self.crashed):
+            self.discard(self.idle.popleft()[0])
+            self.evicted += 1
+
+    def discard(self, page):
+        self.crashed.discard(page)
+        page.deleteLater()
+
+    def clear(self):
+        """Delete the idle pages and drop the waiting requests"""
+        while self.idle:
+            self.discard(self.idle.popleft()[0])
+        self.waiting.clear()
+
+
+class SandboxInterceptor(QtWebEngineCore.QWebEngineUrlRequestInterceptor):
+    """Block all requests of a profile but those of the given schemes"""
+
+    def __init__(self, schemes=SandboxSchemes, parent=None):
+        QtWebEngineCore.QWebEngineUrlRequestInterceptor.__init__(self, parent)
+        self.schemes = frozenset(schemes)
+
+    def interceptRequest(self, info):
+        if info.requestUrl().scheme() not in self.schemes:
+            info.block(True)
+
+
+def sandboxPool(pages, parent=None, schemes=SandboxSchemes, minPages=0):
+    """
+    Return a PagePool for untrusted documents
+
+    The pages run no scripts of the document and request nothing but
+    URLs of schemes. The runtime and the scripts run with runJavaScript
+    in jsruntime.WorldId still work.
+
+    :param pages: Pages alive at most
+    :param parent: Parent of the pool. Defaults to None
+    :param schemes: URL schemes the pages may request. Defaults to
+        SandboxSchemes
+    :param minPages: Pages kept when idle. Defaults to 0
+    """
+    profile = QtWebEngineWidgets.QWebEngineProfile()
+    profile.settings().setAttribute(QtWebEngineWidgets.QWebEngineSettings.JavascriptEnabled, False)
+    profile.interceptor = SandboxInterceptor(schemes, profile)
+    profile.setUrlRequestInterceptor(profile.interceptor)
+    pool = PagePool(maxPages=pages, minPages=minPages, profile=profile, parent=parent)
+    profile.setParent(pool)
+    return pool
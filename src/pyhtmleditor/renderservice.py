@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Render HTML documents to PDF files and PNG thumbnails offscreen
+
+Run headless with e.g.:
+
+    python -m pyhtmleditor.renderservice --pdf doc.pdf --thumbnail doc.png doc.html
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import collections
+
+from PyQt5 import QtCore, QtGui, QtWidgets, QtWebEngineWidgets
+
+from pyhtmleditor import schemehandler
+from pyhtmleditor.pagepool import PagePool
+from pyhtmleditor.saver import writeAtomic
+
+# kinds of results
+Pdf = "pdf"
+Thumbnail = "png"
+
+# jobs waiting for a page, further submissions are rejected
+MaxQueue = 64
+
+# jobs rendering at the same time
+Concurrency = 2
+
+# milliseconds a job may take before it fails
+Timeout = 30000
+
+# results kept in memory, by content hash
+CacheSize = 64
+
+# size of the viewport a thumbnail is taken from, and the thumbnail width
+ViewportSize = QtCore.QSize(1024, 768)
+ThumbnailWidth = 256
+
+# milliseconds between the load and the grab, the renderer paints in between
+PaintDelay = 100
+
+# QWebEnginePage.setHtml refuses larger documents
+SetHtmlLimit = 2 * 1024 * 1024 - 1024
+
+
+def renderKey(kind, data, options, baseDir=None):
+    """
+    Return the cache key of a rendering
+
+    Relative subresources resolve against baseDir, the same document
+    saved elsewhere may look different. Inserted images are stored by
+    content hash, so changed images come with a changed document.
+    """
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps([kind, options, baseDir], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderJob(object):
+
+    def __init__(self, id, kind, data, fileName, options, key):
+        self.id = id
+        self.kind = kind
+        self.data = data
+        self.fileName = fileName
+        self.options = options
+        self.key = key
+        self.page = None
+        self.view = None
+        # doc: URL the data is served at
+        self.url = None
+        self.timer = None
+        self.loadSlot = None
+        self.done = False
+
+
+class RenderService(QtCore.QObject):
+    """
+    Queue of PDF and thumbnail renderings on pooled offscreen pages
+
+    render() returns a job id, or None when MaxQueue jobs are waiting.
+    finished(job, data, error) is emitted with the PDF or PNG bytes, or
+    with an error message. Results are cached by the hash of the
+    document, its directory and the render options, in memory and, if
+    given, in cacheDir, so an unchanged document is not rendered again.
+    """
+
+    finished = QtCore.pyqtSignal(int, bytes, str)
+
+    def __init__(self, pool=None, concurrency=Concurrency, maxQueue=MaxQueue,
+            timeout=Timeout, cacheDir=None, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.pool = pool or PagePool(maxPages=concurrency, parent=self)
+        self.concurrency = concurrency
+        self.maxQueue = maxQueue
+        self.timeout = timeout
+        self.cacheDir = cacheDir
+        self.cache = collections.OrderedDict()
+        self.queue = collections.deque()
+        self.active = 0
+        self.nextId = 1
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, kind, html, fileName=None, **options):
+        """
+        Queue the rendering of a document
+
+        :param kind: Pdf or Thumbnail
+        :param html: The document, a string or bytes
+        :param fileName: Path the document is saved as, relative assets
+            resolve against its directory. Defaults to None
+        :param options: Thumbnail width=ThumbnailWidth for thumbnails
+        """
+        data = html.encode("utf-8") if isinstance(html, str) else bytes(html)
+        baseDir = os.path.dirname(os.path.abspath(fileName)) if fileName else None
+        key = renderKey(kind, data, options, baseDir)
+        job = RenderJob(self.nextId, kind, data, fileName, options, key)
+        self.nextId += 1
+
+        result = self.cached(key, kind)
+        if result is not None:
+            self.hits += 1
+            QtCore.QTimer.singleShot(0, lambda: self.finished.emit(job.id, result, ""))
+            return job.id
+        if len(self.queue) >= self.maxQueue:
+            return None
+        self.misses += 1
+        self.queue.append(job)
+        self.pump()
+        return job.id
+
+    def queueDepth(self):
+        return len(self.queue)
+
+    def cached(self, key, kind):
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            return result
+        if self.cacheDir:
+            try:
+                with open(os.path.join(self.cacheDir, key + "." + kind), "rb") as fd:
+                    result = fd.read()
+            except (IOError, OSError):
+                return None
+            self.remember(key, kind, result, persist=False)
+        return result
+
+    def remember(self, key, kind, result, persist=True):
+        self.cache[key] = result
+        while len(self.cache) > CacheSize:
+            self.cache.popitem(last=False)
+        if persist and self.cacheDir:
+            try:
+                if not os.path.isdir(self.cacheDir):
+                    os.makedirs(self.cacheDir)
+                writeAtomic(os.path.join(self.cacheDir, key + "." + kind), result)
+            except OSError as e:
+                print("cannot cache rendering: %s" % e)
+
+    def pump(self):
+        while self.queue and self.active < self.concurrency:
+            job = self.queue.popleft()
+            self.active += 1
+            self.pool.acquire(lambda page, job=job: self.start(job, page))
+
+    def start(self, job, page):
+        job.page = page
+        job.timer = QtCore.QTimer(self)
+        job.timer.setSingleShot(True)
+        job.timer.timeout.connect(lambda: self.fail(job, "timed out"))
+        job.timer.start(self.timeout)
+
+        if job.kind == Thumbnail:
+            # only a widget can be grabbed, it is never shown on screen
+            job.view = QtWebEngineWidgets.QWebEngineView()
+            job.view.setAttribute(QtCore.Qt.WA_DontShowOnScreen)
+            job.view.setPage(page)
+            job.view.resize(ViewportSize)
+            job.view.show()
+
+        job.loadSlot = lambda ok: self.loaded(job, ok)
+        page.loadFinished.connect(job.loadSlot)
+        if job.fileName:
+            # served by the scheme handler until the job is done, no size limit
+            self.pool.schemeHandler.allow(os.path.dirname(os.path.abspath(job.fileName)))
+            job.url = self.pool.schemeHandler.setContent(job.fileName, job.data)
+            page.load(job.url)
+        elif len(job.data) < SetHtmlLimit:
+            page.setHtml(job.data.decode("utf-8"))
+        else:
+            self.fail(job, "document too large without a file name")
+
+    def loaded(self, job, ok):
+        if job.done:
+            return
+        if not ok:
+            self.fail(job, "load failed")
+        elif job.kind == Pdf:
+            layout = QtGui.QPageLayout(QtGui.QPageSize(QtGui.QPageSize.A4),
+                    QtGui.QPageLayout.Portrait, QtCore.QMarginsF())
+            job.page.printToPdf(lambda pdf: self.printed(job, pdf), layout)
+        else:
+            QtCore.QTimer.singleShot(PaintDelay, lambda: self.grab(job))
+
+    def printed(self, job, pdf):
+        if not pdf:
+            self.fail(job, "printing failed")
+        else:
+            self.succeed(job, bytes(pdf))
+
+    def grab(self, job):
+        if job.done:
+            return
+        image = job.view.grab().toImage()
+        width = job.options.get("width", ThumbnailWidth)
+        image = image.scaledToWidth(width, QtCore.Qt.SmoothTransformation)
+        buf = QtCore.QBuffer()
+        buf.open(QtCore.QIODevice.WriteOnly)
+        if not image.save(buf, "PNG"):
+            self.fail(job, "encoding failed")
+        else:
+            self.succeed(job, bytes(buf.data()))
+
+    def succeed(self, job, result):
+        self.remember(job.key, job.kind, result)
+        self.finish(job, result, "")
+
+    def fail(self, job, error):
+        self.finish(job, b"", error)
+
+    def finish(self, job, result, error):
+        if job.done:
+            return
+        job.done = True
+        job.timer.stop()
+        job.timer.deleteLater()
+        if job.view is not None:
+            job.view.deleteLater()
+            job.view = None
+        job.page.loadFinished.disconnect(job.loadSlot)
+        if job.url is not None:
+            self.pool.schemeHandler.removeContent(job.url)
+            job.url = None
+        self.pool.release(job.page)
+        job.page = None
+        job.data = None
+        self.active -= 1
+        self.finished.emit(job.id, result, error)
+        self.pump()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("file", help="HTML file")
+    parser.add_argument("--pdf", metavar="FILE", help="write a PDF to FILE")
+    parser.add_argument("--thumbnail", metavar="FILE", help="write a PNG thumbnail to FILE")
+    parser.add_argument("--width", type=int, default=ThumbnailWidth, help="thumbnail width")
+    parser.add_argument("--timeout", type=int, default=Timeout, help="milliseconds per job")
+    parser.add_argument("--cache", metavar="DIR", help="cache the results in DIR")
+    args = parser.parse_args(argv)
+    if not args.pdf and not args.thumbnail:
+        parser.error("nothing to render, use --pdf and/or --thumbnail")
+
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    schemehandler.registerScheme()
+    app = QtWidgets.QApplication(sys.argv[:1])
+    with open(args.file, "rb") as fd:
+        html = fd.read()
+
+    service = RenderService(timeout=args.timeout, cacheDir=args.cache)
+    targets = {}
+    if args.pdf:
+        targets[service.render(Pdf, html, args.file)] = args.pdf
+    if args.thumbnail:
+        targets[service.render(Thumbnail, html, args.file, width=args.width)] = args.thumbnail
+    errors = []
+
+    def finished(job, data, error):
+        if error:
+            errors.append(error)
+            print("%s: %s" % (targets[job], error))
+        else:
+            writeAtomic(targets[job], data)
+        del targets[job]
+        if not targets:
+            app.quit()
+
+    service.finished.connect(finished)
+    app.exec_()
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+
+from PyQt5 import QtCore
+
+# bytes written between two progress reports
+WriteChunk = 1024 * 1024
+
+# mode of new files, mkstemp creates them readable by the owner only;
+# the umask can only be read by setting it, which is done once here and
+# not by the writer threads
+_umask = os.umask(0)
+os.umask(_umask)
+NewFileMode = 0o666 & ~_umask
+
+
+def writeAtomic(fileName, data, progress=None):
+    """
+    Write data to fileName so that it is either completely replaced or
+    left alone
+
+    The data goes to a temporary file in the same directory, which is
+    synced to disk and then renamed over fileName. fileName keeps its
+    mode, a new file gets the mode open() would give it.
+
+    :param fileName: Path of the file
+    :param data: The bytes to write
+    :param progress: Called with (written, total) after each chunk.
+        Defaults to None
+    """
+    directory = os.path.dirname(os.path.abspath(fileName))
+    fd, tmpName = tempfile.mkstemp(dir=directory,
+            prefix="." + os.path.basename(fileName) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            total = len(data)
+            view = memoryview(data)
+            for pos in range(0, total, WriteChunk):
+                tmp.write(view[pos:pos + WriteChunk])
+                if progress:
+                    progress(min(pos + WriteChunk, total), total)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        if os.path.exists(fileName):
+            os.chmod(tmpName, os.stat(fileName).st_mode & 0o7777)
+        else:
+            os.chmod(tmpName, NewFileMode)
+        os.replace(tmpName, fileName)
+    except BaseException:
+        if os.path.exists(tmpName):
+            os.unlink(tmpName)
+        raise
+
+    # make the rename itself durable
+    if hasattr(os, "O_DIRECTORY"):
+        dirFd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dirFd)
+        finally:
+            os.close(dirFd)
+
+
+class SaveSignals(QtCore.QObject):
+    progress = QtCore.pyqtSignal(str, int, int)
+    finished = QtCore.pyqtSignal(str, bool, str)
+
+
+class SaveJob(QtCore.QRunnable):
+
+    def __init__(self, fileName, html, signals):
+        QtCore.QRunnable.__init__(self)
+        self.fileName = fileName
+        self.html = html
+        self.signals = signals
+
+    def run(self):
+        try:
+            data = self.html.encode("utf-8")
+            self.html = None
+            writeAtomic(self.fileName, data,
+                    lambda written, total: self.signals.progress.emit(self.fileName, written, total))
+        except Exception as e:
+            # every save has to finish, the editor waits for it
+            self.signals.finished.emit(self.fileName, False, str(e) or type(e).__name__)
+        else:
+            self.signals.finished.emit(self.fileName, True, "")
+
+
+class DocumentSaver(QtCore.QObject):
+    """
+    Save the HTML of a QWebEnginePage without blocking the GUI thread
+
+    The HTML is fetched with the asynchronous toHtml, then encoded and
+    written atomically on a worker thread. Progress and completion are
+    reported with the progress and finished signals.
+    """
+
+    progress = QtCore.pyqtSignal(str, int, int)
+    finished = QtCore.pyqtSignal(str, bool, str)
+
+    def __init__(self, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.pending = 0
+        self.pool = QtCore.QThreadPool(self)
+        # one writer, saves of the same file must not overtake each other
+        self.pool.setMaxThreadCount(1)
+        self.signals = SaveSignals(self)
+        self.signals.progress.connect(self.progress)
+        self.signals.finished.connect(self.jobFinished)
+
+    def isBusy(self):
+        return self.pending > 0
+
+    def save(self, page, fileName):
+        self.pending += 1
+        page.toHtml(lambda html: self.write(fileName, html))
+
+    def write(self, fileName, html):
+        self.pool.start(SaveJob(fileName, html, self.signals))
+
+    def jobFinished(self, fileName, ok, error):
+        self.pending -= 1
+        self.finished.emit(fileName, ok, error)
+
+    def waitForDone(self):
+        self.pool.waitForDone()
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from PyQt5 import QtCore, QtWebEngineCore
+
+# documents and their assets are served as doc:/path/to/file.html
+Scheme = b"doc"
+
+# query item of the URL a document is loaded from, the document is
+# served as text/html whatever its file name; relative URLs in it
+# resolve without the query, so its assets keep their own types
+DocumentQuery = "document"
+
+# query item of the URL contents set for a file are loaded from, each
+# setContent() gets its own value
+ContentQuery = "content"
+
+
+def registerScheme():
+    """
+    Register the doc scheme with QtWebEngine
+
+    Has to be called before the QApplication is created.
+    """
+    scheme = QtWebEngineCore.QWebEngineUrlScheme(Scheme)
+    scheme.setSyntax(QtWebEngineCore.QWebEngineUrlScheme.Syntax.Path)
+    scheme.setFlags(QtWebEngineCore.QWebEngineUrlScheme.SecureScheme |
+            QtWebEngineCore.QWebEngineUrlScheme.LocalScheme |
+            QtWebEngineCore.QWebEngineUrlScheme.ContentSecurityPolicyIgnored)
+    QtWebEngineCore.QWebEngineUrlScheme.registerScheme(scheme)
+
+
+def urlForFile(fileName, document=False):
+    """
+    Return the doc: URL of fileName
+
+    :param fileName: Path of the file
+    :param document: Whether the URL is loaded as a document, which is
+        always served as text/html. Defaults to False
+    """
+    path = QtCore.QFileInfo(fileName).absoluteFilePath()
+    if not path.startswith("/"):
+        # e.g. C:/foo.html
+        path = "/" + path
+    url = QtCore.QUrl()
+    url.setScheme(Scheme.decode())
+    # file names may contain '%', '?' or '#'
+    url.setPath(path, QtCore.QUrl.DecodedMode)
+    if document:
+        query = QtCore.QUrlQuery()
+        query.addQueryItem(DocumentQuery, "")
+        url.setQuery(query)
+    return url
+
+
+def fileForUrl(url):
+    path = url.path()
+    if len(path) > 2 and path[2] == ":":
+        path = path[1:]
+    return QtCore.QDir.cleanPath(path)
+
+
+def realPath(fileName):
+    # the path with symbolic links resolved, if the file exists
+    info = QtCore.QFileInfo(fileName)
+    return info.canonicalFilePath() or QtCore.QDir.cleanPath(info.absoluteFilePath())
+
+
+class DocSchemeHandler(QtWebEngineCore.QWebEngineUrlSchemeHandler):
+    """
+    Serve local files for doc: URLs straight from disk
+
+    The renderer reads the reply from a QFile, so documents of any size
+    load without a copy in Python, and relative links resolve against
+    the directory of the document. Only files below the allowed
+    directories are served.
+    """
+
+    def __init__(self, parent=None):
+        QtWebEngineCore.QWebEngineUrlSchemeHandler.__init__(self, parent)
+        self.roots = set()
+        # (path, content query value) to the bytes served
+        self.contents = {}
+        self.nextContent = 1
+        self.mimeDatabase = QtCore.QMimeDatabase()
+
+    def allow(self, directory):
+        self.roots.add(realPath(directory))
+
+    def setContent(self, fileName, data):
+        """
+        Serve data as the document fileName and return its URL
+
+        The URL has a query item of its own, the file and other contents
+        set for it stay apart. Relative links resolve against the
+        directory of fileName. The data is served until removeContent().
+
+        :param fileName: Path of the file
+        :param data: The bytes to serve
+        """
+        url = urlForFile(fileName, document=True)
+        query = QtCore.QUrlQuery(url)
+        query.addQueryItem(ContentQuery, str(self.nextContent))
+        url.setQuery(query)
+        self.nextContent += 1
+        self.contents[self.contentKey(url)] = data
+        return url
+
+    def removeContent(self, url):
+        """
+        Stop serving the contents set for url
+
+        :param url: URL returned by setContent()
+        """
+        self.contents.pop(self.contentKey(url), None)
+
+    def contentKey(self, url):
+        query = QtCore.QUrlQuery(url)
+        if not query.hasQueryItem(ContentQuery):
+            return None
+        return fileForUrl(url), query.queryItemValue(ContentQuery)
+
+    def isAllowed(self, path):
+        # symbolic links are resolved, a link pointing out of the allowed
+        # directories is denied
+        path = realPath(path)
+        for root in self.roots:
+            if path == root or path.startswith(root.rstrip("/") + "/"):
+                return True
+        return False
+
+    def mimeType(self, url, info):
+        # documents and the contents set for them are HTML, the MIME
+        # database only guesses from the name
+        if QtCore.QUrlQuery(url).hasQueryItem(DocumentQuery):
+            return b"text/html"
+        return self.mimeDatabase.mimeTypeForFile(info).name().encode()
+
+    def requestStarted(self, job):
+        url = job.requestUrl()
+        path = fileForUrl(url)
+        info = QtCore.QFileInfo(path)
+        if not self.isAllowed(path):
+            job.fail(QtWebEngineCore.QWebEngineUrlRequestJob.RequestDenied)
+            return
+        key = self.contentKey(url)
+        if key is not None:
+            # removed contents are not replaced by the file on disk
+            data = self.contents.get(key)
+            if data is None:
+                job.fail(QtWebEngineCore.QWebEngineUrlRequestJob.UrlNotFound)
+                return
+            buf = QtCore.QBuffer(job)
+            buf.setData(data)
+            buf.open(QtCore.QIODevice.ReadOnly)
+            job.reply(b"text/html", buf)
+            return
+        if not info.isFile():
+            job.fail(QtWebEngineCore.QWebEngineUrlRequestJob.UrlNotFound)
+            return
+
+        # the job owns the device, it is closed when the job is done
+        fd = QtCore.QFile(path, job)
+        if not fd.open(QtCore.QIODevice.ReadOnly):
+            job.fail(QtWebEngineCore.QWebEngineUrlRequestJob.RequestDenied)
+            return
+        job.reply(self.mimeType(url, info), fd)
+
+
+def install(profile):
+    """
+    Install a DocSchemeHandler on profile, or return the installed one
+
+    :param profile: The QWebEngineProfile
+    """
+    handler = profile.urlSchemeHandler(Scheme)
+    if handler is None:
+        handler = DocSchemeHandler(profile)
+        profile.installUrlSchemeHandler(Scheme, handler)
+    return handler
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Text helpers for the HTML source view, independent of Qt."""
+
+from pyhtmleditor.htmltokenizer import segmentEnd
+
+
+# lines longer than this are shown as several segments
+LongLine = 1000
+
+
+def splitLines(text, limit=None):
+    """
+    Split text into the blocks shown by QPlainTextEdit
+
+    There is always at least one line. With limit, longer lines, e.g.
+    of minified HTML, are split into segments of at most limit
+    characters, see splitLongLine.
+    """
+    lines = text.split("\n")
+    if limit:
+        segments = []
+        for line in lines:
+            if len(line) > limit:
+                segments.extend(splitLongLine(line, limit))
+            else:
+                segments.append(line)
+        lines = segments
+    return lines
+
+
+def splitSegments(text, limit):
+    """
+    Split text like splitLines, telling which blocks continue their line
+
+    Returns a list of (segment, continued) tuples, continued being True
+    when the line goes on in the next segment, so the highlighter does
+    not end the strings and comments of the line there.
+    """
+    segments = []
+    for line in text.split("\n"):
+        if len(line) > limit:
+            parts = splitLongLine(line, limit)
+            segments.extend((part, True) for part in parts[:-1])
+            segments.append((parts[-1], False))
+        else:
+            segments.append((line, False))
+    return segments
+
+
+def splitLongLine(line, limit):
+    """
+    Split one line into segments of at most limit characters
+
+    Segments end after the last '>' in reach, or else after the last
+    space, so they usually break between tags and tokens stay whole.
+    The highlighter carries its state from segment to segment, see
+    splitSegments.
+    """
+    segments = []
+    length = len(line)
+    pos = 0
+    while length - pos > limit:
+        end = segmentEnd(line, pos, limit)
+        segments.append(line[pos:end])
+        pos = end
+    segments.append(line[pos:])
+    return segments
+
+
+def diffLines(old, new):
+    """
+    Find the single line range that differs between two lists of lines
+
+    Common leading and trailing lines are skipped, old[start:oldEnd]
+    has to be replaced with new[start:newEnd]. Returns None when both
+    are equal.
+
+    :param old: Lines currently shown
+    :param new: Lines to show
+    """
+    count = min(len(old), len(new))
+    start = 0
+    while start < count and old[start] == new[start]:
+        start += 1
+    oldEnd = len(old)
+    newEnd = len(new)
+    if start == oldEnd and start == newEnd:
+        return None
+    while oldEnd > start and newEnd > start and old[oldEnd - 1] == new[newEnd - 1]:
+        oldEnd -= 1
+        newEnd -= 1
+    return start, oldEnd, newEnd
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from PyQt5 import QtCore, QtWidgets
+
+from pyhtmleditor.highlighter import isContinued
+
+# QTextCursor.selectedText separates blocks with this
+ParagraphSeparator = u"\u2029"
+
+
+def selectedSource(cursor):
+    """
+    Return the text selected by cursor without the segment breaks
+
+    Blocks continuing their line are joined to the next one again, other
+    blocks end with a newline.
+
+    :param cursor: QTextCursor on the source view document
+    """
+    pieces = cursor.selectedText().split(ParagraphSeparator)
+    block = cursor.document().findBlock(cursor.selectionStart())
+    text = [pieces[0]]
+    for piece in pieces[1:]:
+        if not isContinued(block):
+            text.append("\n")
+        text.append(piece)
+        block = block.next()
+    return "".join(text)
+
+
+class SourceView(QtWidgets.QPlainTextEdit):
+    """
+    Plain text edit showing the HTML source
+
+    Long lines are shown as several blocks, see sourcetext.splitSegments.
+    Copied and dragged text is the source as serialized, the breaks
+    between the segments of a line are left out.
+    """
+
+    def createMimeDataFromSelection(self):
+        mime = QtCore.QMimeData()
+        mime.setText(selectedSource(self.textCursor()))
+        return mime
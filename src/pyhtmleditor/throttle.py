@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+# Author: Milan Nikolic <gen2brain@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from PyQt5 import QtCore
+
+# one refresh per frame at 60 Hz
+FrameInterval = 16
+
+
+class Throttle(QtCore.QObject):
+    """
+    Coalesce bursts of events into at most one call per interval
+
+    The first event of a burst is handled at once, on the leading edge.
+    Events arriving within the interval after a call are merged into
+    one more call at its end, so the last event of a burst is always
+    followed by a call and a steady stream of events still gets one
+    call per interval.
+    """
+
+    def __init__(self, callback, interval=FrameInterval, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.callback = callback
+        self.received = 0
+        self.processed = 0
+        # an event arrived since the last call
+        self.pending = False
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.timeout)
+
+    def interval(self):
+        return self.timer.interval()
+
+    def setInterval(self, interval):
+        self.timer.setInterval(interval)
+
+    def dropped(self):
+        # events merged into a call, the pending one is not dropped yet
+        return self.received - self.processed - int(self.pending)
+
+    def resetCounters(self):
+        self.received = 0
+        self.processed = 0
+
+    @QtCore.pyqtSlot()
+    def trigger(self):
+        self.received += 1
+        if self.timer.isActive():
+            self.pending = True
+        else:
+            self.call()
+
+    @QtCore.pyqtSlot()
+    def flush(self):
+        """Make the pending call now"""
+        if self.pending:
+            self.call()
+
+    def timeout(self):
+        if self.pending:
+            self.call()
+
+    def call(self):
+        self.pending = False
+        self.processed += 1
+        # calls are at least one interval apart
+        self.timer.start()
+        self.callback()
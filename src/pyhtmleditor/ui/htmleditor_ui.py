@@ -38,7 +38,7 @@ class Ui_MainWindow(object):
         self.verticalLayout_3 = QtWidgets.QVBoxLayout(self.tab_2)
         self.verticalLayout_3.setContentsMargins(0, 0, 0, 0)
         self.verticalLayout_3.setObjectName("verticalLayout_3")
-        self.plainTextEdit = QtWidgets.QPlainTextEdit(self.tab_2)
+        self.plainTextEdit = SourceView(self.tab_2)
         self.plainTextEdit.setFrameShape(QtWidgets.QFrame.NoFrame)
         self.plainTextEdit.setReadOnly(True)
         self.plainTextEdit.setObjectName("plainTextEdit")
@@ -393,4 +393,5 @@ class Ui_MainWindow(object):
 
 
 from PyQt5 import QtWebEngineWidgets
+from pyhtmleditor.sourceview import SourceView
 from pyhtmleditor.ui import htmleditor_rc
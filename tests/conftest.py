@@ -0,0 +1,25 @@
+import os
+import sys
+
+# run against the sources, the package does not have to be installed
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def qapp():
+    """The QApplication shared by all Qt tests, offscreen"""
+    QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QtWidgets.QApplication.instance()
+    if app is None:
+        # WebEngine has to be set up before the application, if present
+        try:
+            from PyQt5 import QtWebEngineWidgets  # noqa: F401
+            from pyhtmleditor import schemehandler
+            schemehandler.registerScheme()
+        except ImportError:
+            pass
+        app = QtWidgets.QApplication(["test"])
+    return app
@@ -0,0 +1,58 @@
+import os
+
+from pyhtmleditor import assets
+
+
+def test_blobs_move_between_stores(tmp_path):
+    image = tmp_path / "photo.png"
+    image.write_bytes(b"\x89PNG not really")
+    cache = assets.AssetStore(str(tmp_path / "cache" / assets.AssetDir))
+    first = assets.storeForDocument(str(tmp_path / "a" / "doc.html"), cache)
+    second = assets.storeForDocument(str(tmp_path / "b" / "doc.html"), cache)
+
+    blob = first.add(str(image))
+    digest = assets.blobDigest(blob)
+    assert digest == assets.fileDigest(str(image))
+    assert assets.blobDigest(str(image)) is None
+
+    moved = second.add(blob, digest)
+    assert moved.startswith(second.root)
+    assert open(moved, "rb").read() == image.read_bytes()
+    assert assets.relativeUrl(moved, str(tmp_path / "b")) == \
+            "/".join([assets.AssetDir, digest[:2], digest + ".png"])
+    assert os.path.exists(blob)
+
+
+def test_same_contents_are_stored_once(tmp_path):
+    first = tmp_path / "a.png"
+    second = tmp_path / "b.PNG"
+    first.write_bytes(b"same")
+    second.write_bytes(b"same")
+    store = assets.AssetStore(str(tmp_path / assets.AssetDir))
+
+    blob = store.add(str(first))
+    assert store.add(str(second)) == blob
+    assert os.listdir(os.path.dirname(blob)) == [os.path.basename(blob)]
+
+
+def test_blobs_are_read_only(tmp_path):
+    image = tmp_path / "photo.png"
+    image.write_bytes(b"pixels")
+    cache = assets.AssetStore(str(tmp_path / "cache" / assets.AssetDir))
+    first = assets.storeForDocument(str(tmp_path / "a" / "doc.html"), cache)
+    second = assets.storeForDocument(str(tmp_path / "b" / "doc.html"), cache)
+
+    blobs = [first.add(str(image)), second.add(str(image))]
+    for blob in blobs:
+        assert os.stat(blob).st_mode & 0o777 == assets.BlobMode
+    # the inserted file is copied, editing it changes no blob
+    image.write_bytes(b"edited")
+    assert all(open(blob, "rb").read() == b"pixels" for blob in blobs)
+
+
+def test_relative_url_across_directories(tmp_path):
+    blob = os.path.join(str(tmp_path), "a", assets.AssetDir, "ab", "ab.png")
+    assert assets.relativeUrl(blob, os.path.join(str(tmp_path), "a")) == \
+            assets.AssetDir + "/ab/ab.png"
+    assert assets.relativeUrl(blob, os.path.join(str(tmp_path), "b", "sub")) == \
+            "../../a/" + assets.AssetDir + "/ab/ab.png"
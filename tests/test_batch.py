@@ -0,0 +1,69 @@
+import pytest
+
+pytest.importorskip("PyQt5.QtWebEngineWidgets")
+
+from PyQt5.QtWebEngineWidgets import QWebEnginePage
+
+from pyhtmleditor import batch
+
+Document = ('<html><body><p><a href="http://old/page.html">link</a></p>'
+        '<script>document.body.setAttribute("data-ran", "yes");</script>'
+        '</body></html>')
+
+
+def options(tmp_path, **kwargs):
+    values = {
+        "output": str(tmp_path / "out"),
+        "root": str(tmp_path),
+        "commands": [],
+        "links": [["http://old/", "https://new/"]],
+        "inlineImages": False,
+    }
+    values.update(kwargs)
+    return values
+
+
+@pytest.fixture
+def document(tmp_path):
+    path = tmp_path / "doc.html"
+    path.write_text(Document)
+    return path
+
+
+def run(qapp, opts, files):
+    pool = batch.workerPool(2)
+    try:
+        runner = batch.BatchRunner(opts, pool)
+        return runner, runner.run([str(f) for f in files])
+    finally:
+        pool.clear()
+
+
+def test_files_are_normalized_without_their_scripts(qapp, tmp_path, document):
+    runner, results = run(qapp, options(tmp_path), [document])
+    assert [(f, error) for f, s, error in results] == [(str(document), "")]
+    html = (tmp_path / "out" / "doc.html").read_text()
+    assert 'href="https://new/page.html"' in html
+    assert "data-ran" not in html
+    # the pages went back to the pool without a slot of the runner
+    assert not runner.jobs and not runner.pool.busy
+
+
+def test_slow_files_time_out(qapp, tmp_path, document):
+    runner, results = run(qapp, options(tmp_path, timeout=1), [document])
+    assert [(f, error) for f, s, error in results] == [(str(document), "timed out")]
+    assert not (tmp_path / "out" / "doc.html").exists()
+
+
+def test_terminated_renderer_fails_the_file(qapp, tmp_path, document, monkeypatch):
+    start = batch.BatchRunner.start
+
+    def crashingStart(self, page):
+        start(self, page)
+        page.renderProcessTerminated.emit(QWebEnginePage.CrashedTerminationStatus, 11)
+
+    monkeypatch.setattr(batch.BatchRunner, "start", crashingStart)
+    runner, results = run(qapp, options(tmp_path), [document])
+    assert [(f, error) for f, s, error in results] == [
+            (str(document), "renderer process terminated")]
+    assert not (tmp_path / "out" / "doc.html").exists()
@@ -0,0 +1,166 @@
+import random
+
+import pytest
+
+pytest.importorskip("PyQt5.QtWidgets")
+
+from PyQt5 import QtGui, QtWidgets
+
+try:
+    from PyQt5 import sip
+except ImportError:
+    import sip
+
+from pyhtmleditor import sourcetext
+from pyhtmleditor.highlighter import (Highlighter, ColorSchemes, State_Pending,
+        LazyMargin, BackgroundThreshold, markContinued, replaceLines)
+from pyhtmleditor.htmltokenizer import Tag
+
+# short segments, so continued lines show up in small documents
+SegmentLimit = 40
+
+Fragments = [
+    '<p class="a">', "</p>", "text ", "&amp;", "<!-- a ", "comment -->",
+    "<script>var s = 'x';", "</script>", "<style>p { color: red; }",
+    "</style>", '<a href="x y">', "'", '"', "\n", "\n", "\n",
+]
+
+
+def randomHtml(rnd, count):
+    return "".join(rnd.choice(Fragments) for i in range(count))
+
+
+def blocks(document):
+    block = document.begin()
+    while block.isValid():
+        yield block
+        block = block.next()
+
+
+def highlighting(document):
+    return [(block.text(), block.userState(),
+            [(r.start, r.length, r.format.foreground().color().name())
+                    for r in block.layout().formats()])
+            for block in blocks(document)]
+
+
+def eager(segments):
+    # the whole text highlighted from scratch
+    document = QtGui.QTextDocument()
+    document.setPlainText("\n".join(line for line, continued in segments))
+    for block, (line, continued) in zip(blocks(document), segments):
+        markContinued(block, continued)
+    Highlighter(document).rehighlight()
+    return document
+
+
+def test_replaced_lines_highlight_like_the_whole_text(qapp):
+    rnd = random.Random(7)
+    document = QtGui.QTextDocument()
+    highlighter = Highlighter(document)
+    shown = sourcetext.splitSegments("", SegmentLimit)
+    replaceLines(document, 0, document.blockCount(), shown)
+    for i in range(50):
+        # an edit somewhere in the text, like the page serializes it
+        text = "\n".join(line for line, continued in shown)
+        start = rnd.randint(0, len(text))
+        end = min(len(text), start + rnd.randint(0, 40))
+        text = text[:start] + randomHtml(rnd, rnd.randint(0, 8)) + text[end:]
+
+        segments = sourcetext.splitSegments(text, SegmentLimit)
+        diff = sourcetext.diffLines(shown, segments)
+        if diff is not None:
+            first, oldEnd, newEnd = diff
+            replaceLines(document, first, oldEnd, segments[first:newEnd])
+        shown = segments
+        assert highlighting(document) == highlighting(eager(segments))
+    # untouched lines were replayed from the cache
+    assert highlighter.cacheHits > 0
+
+
+def test_lazy_states_settle_to_the_eager_chain(qapp):
+    rnd = random.Random(3)
+    text = "\n".join(randomHtml(rnd, 6).replace("\n", " ") for i in range(3000))
+    view = QtWidgets.QPlainTextEdit()
+    view.resize(400, 300)
+    view.show()
+    highlighter = Highlighter(view.document())
+    highlighter.setLazy(view)
+    view.setPlainText(text)
+
+    states = [block.userState() for block in blocks(view.document())]
+    assert states[-1] == State_Pending
+    assert State_Pending not in states[:LazyMargin]
+
+    for i in range(100000):
+        if view.document().lastBlock().userState() != State_Pending:
+            break
+        qapp.processEvents()
+    reference = eager(sourcetext.splitSegments(text, len(text) + 1))
+    assert highlighting(view.document()) == highlighting(reference)
+
+    highlighter.setLazy(None)
+    view.close()
+
+
+def test_teardown_stops_a_running_scan(qapp):
+    view = QtWidgets.QPlainTextEdit()
+    highlighter = Highlighter(view.document())
+    highlighter.setLazy(view)
+    highlighter.setBackground(True)
+    line = '<p class="a">text &amp; <a href="x">link</a></p>'
+    view.setPlainText("\n".join([line] * (2 * BackgroundThreshold // len(line))))
+    thread = highlighter.scanThread
+    assert thread is not None and thread.isRunning()
+
+    # Qt aborts when a running QThread is destroyed
+    sip.delete(view)
+    assert sip.isdeleted(thread)
+
+
+def test_cache_replays_known_lines(qapp):
+    document = QtGui.QTextDocument()
+    highlighter = Highlighter(document)
+    document.setPlainText("\n".join(["<p>x</p>"] * 100))
+    assert highlighter.cacheMisses <= 2
+    assert highlighter.cacheHitRate() > 0.9
+
+    highlighter.cacheHits = highlighter.cacheMisses = 0
+    highlighter.rehighlight()
+    assert (highlighter.cacheHits, highlighter.cacheMisses) == (100, 0)
+    assert highlighter.cacheHitRate() == 1.0
+
+
+def test_cache_drops_the_least_recently_used(qapp):
+    highlighter = Highlighter(QtGui.QTextDocument())
+    highlighter.setCacheSize(2)
+    for text in ("<a>", "<b>", "<a>", "<i>"):
+        highlighter.scanBlock(text, -1)
+    assert (highlighter.cacheHits, highlighter.cacheMisses) == (1, 3)
+    # "<b>" was evicted, "<a>" was used again before "<i>" came in
+    highlighter.scanBlock("<a>", -1)
+    highlighter.scanBlock("<b>", -1)
+    assert (highlighter.cacheHits, highlighter.cacheMisses) == (2, 4)
+
+    highlighter.setCacheSize(0)
+    assert len(highlighter.cache) == 0
+
+
+def test_color_scheme_switches_all_highlighters(qapp):
+    documents = [QtGui.QTextDocument() for i in range(2)]
+    highlighters = [Highlighter(document) for document in documents]
+    assert set(highlighters) <= set(Highlighter.instances)
+    for document in documents:
+        document.setPlainText("<p>x</p>")
+
+    def tagColors():
+        return [document.begin().layout().formats()[0].format.foreground().color().getRgb()[:3]
+                for document in documents]
+
+    try:
+        Highlighter.setColorScheme("default")
+        assert tagColors() == [ColorSchemes["default"][Tag]] * 2
+        Highlighter.setColorScheme("dark")
+        assert tagColors() == [ColorSchemes["dark"][Tag]] * 2
+    finally:
+        Highlighter.setColorScheme("default")
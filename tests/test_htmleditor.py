@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5.QtWebEngineWidgets")
+
+from PyQt5 import QtCore, QtWidgets
+
+from pyhtmleditor import assets
+from pyhtmleditor.htmleditor import HtmlEditor
+
+SelectionEvents = 10000
+
+# milliseconds a save may take in the tests
+SaveTimeout = 10000
+
+
+@pytest.fixture(scope="module")
+def editor(qapp):
+    editor = HtmlEditor()
+    yield editor
+    editor.setWindowModified(False)
+    editor.close()
+
+
+def connections(editor):
+    return dict((action, action.receivers(action.triggered))
+            for action in editor.pageActions)
+
+
+def test_page_actions_are_wired_once(editor):
+    before = connections(editor)
+    page = editor.webView.page()
+    for i in range(SelectionEvents):
+        page.selectionChanged.emit()
+        editor.adjustActions()
+    QtWidgets.QApplication.processEvents()
+
+    assert connections(editor) == before
+    assert all(count == 1 for count in before.values())
+
+
+def test_forward_action_is_idempotent(editor):
+    action = editor.actionFormatBold
+    before = action.receivers(action.triggered)
+    editor._forward_action(action, editor.pageActions[action])
+    assert action.receivers(action.triggered) == before
+
+
+def waitForSave(editor):
+    loop = QtCore.QEventLoop()
+    editor.saver.finished.connect(loop.quit)
+    QtCore.QTimer.singleShot(SaveTimeout, loop.quit)
+    loop.exec_()
+    editor.saver.finished.disconnect(loop.quit)
+
+
+@pytest.mark.parametrize("writable", [True, False], ids=["saved", "failed"])
+def test_new_document_waits_for_the_save(editor, tmp_path, monkeypatch, writable):
+    directory = tmp_path if writable else tmp_path / "missing"
+    fileName = str(directory / "doc.html")
+    monkeypatch.setattr(QtWidgets.QMessageBox, "warning",
+            lambda *args: QtWidgets.QMessageBox.Save)
+    editor.setCurrentFileName(fileName)
+    editor.setWindowModified(True)
+
+    editor.fileNew()
+    assert editor.fileName == fileName
+    waitForSave(editor)
+
+    assert os.path.exists(fileName) == writable
+    assert editor.fileName == ("" if writable else fileName)
+    editor.setWindowModified(False)
+
+
+def waitForLoad(editor):
+    loop = QtCore.QEventLoop()
+    editor.webView.loadFinished.connect(loop.quit)
+    QtCore.QTimer.singleShot(SaveTimeout, loop.quit)
+    loop.exec_()
+    editor.webView.loadFinished.disconnect(loop.quit)
+
+
+def test_save_as_moves_the_images_along(editor, tmp_path, monkeypatch):
+    # keep the shared asset cache out of the user's data
+    QtCore.QStandardPaths.setTestModeEnabled(True)
+    image = tmp_path / "photo.png"
+    image.write_bytes(b"\x89PNG not really")
+    first = tmp_path / "a" / "doc.html"
+    first.parent.mkdir()
+    blob = assets.storeForDocument(str(first)).add(str(image))
+    url = assets.relativeUrl(blob, str(first.parent))
+    first.write_text('<p><img src="%s"></p>' % url)
+    second = tmp_path / "b" / "doc.html"
+    second.parent.mkdir()
+    monkeypatch.setattr(QtWidgets.QFileDialog, "getSaveFileName",
+            lambda *args: (str(second), ""))
+
+    assert editor.load(str(first))
+    waitForLoad(editor)
+    assert editor.fileSaveAs()
+    waitForSave(editor)
+
+    assert url in second.read_text()
+    moved = os.path.join(str(second.parent), url)
+    assert open(moved, "rb").read() == image.read_bytes()
+    editor.setWindowModified(False)
@@ -0,0 +1,163 @@
+import io
+import time
+
+import pytest
+
+from pyhtmleditor.htmltokenizer import (scan, tokenizeStream, entityLength, Entity,
+        AttributeValue, Property, String, Tag, State_Text, State_DoubleQuote,
+        unpackState)
+from pyhtmleditor.sourcetext import splitSegments
+
+# the large input is this many times longer than the small one
+Growth = 8
+
+# a scan of the large input may take this many times longer than
+# Growth times the small one, a quadratic scan takes Growth times longer
+Slack = 3
+
+
+def scanTime(text, repeat=3):
+    best = None
+    for i in range(repeat):
+        start = time.perf_counter()
+        scan(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def assertLinear(make, size=20000):
+    small = max(scanTime(make(size)), 1e-4)
+    large = scanTime(make(size * Growth))
+    assert large < small * Growth * Slack, (small, large)
+
+
+@pytest.mark.parametrize("make", [
+    lambda n: "&" * n,
+    lambda n: "&a" * (n // 2),
+    lambda n: "&#" * (n // 2),
+    lambda n: "&#x" + "f" * n,
+    lambda n: "&#" + "9" * n,
+    lambda n: "&" + "a" * n,
+    lambda n: "&amp" * (n // 4),
+    lambda n: "<a b=\"" + "&a" * (n // 2),
+    lambda n: "<a b='" + "x" * n,
+    lambda n: "<a " + "b " * (n // 2),
+    lambda n: "<!--" + "-" * n,
+    lambda n: "<" * n,
+    lambda n: "<p>&amp; &lt;</p> " * (n // 18),
+    lambda n: "<style>a{" + "a" * n,
+    lambda n: "<style>a{" + "-" * n,
+    lambda n: "<style>a{" + "a " * (n // 2),
+    lambda n: "<script>" + "a /" * (n // 3),
+    lambda n: "<script>x = " + "/[a]" * (n // 4),
+], ids=["amp", "amp-a", "amp-hash", "hex", "decimal", "long-name",
+        "unterminated", "quoted-amp", "unterminated-quote", "attributes",
+        "comment", "lt", "long-line", "css-word", "css-dashes", "css-words",
+        "js-division", "js-regex"])
+def test_linear(make):
+    assertLinear(make)
+
+
+def test_entity_length():
+    assert entityLength("&amp;", 0) == 5
+    assert entityLength("x&lt;y", 1) == 4
+    assert entityLength("&#169;", 0) == 6
+    assert entityLength("&#x1F600;", 0) == 9
+    assert entityLength("&#x110000;", 0) == 0
+    assert entityLength("&#99999999;", 0) == 0
+    assert entityLength("&foo;", 0) == 0
+    assert entityLength("&amp", 0) == 0
+    assert entityLength("&#;", 0) == 0
+    assert entityLength("&#x;", 0) == 0
+    assert entityLength("&" + "a" * 100 + ";", 0) == 0
+
+
+def test_entities_are_spans():
+    spans, state = scan("a &amp; b &bogus; c &#65;")
+    entities = [(start, length) for start, length, kind, _ in spans if kind == Entity]
+    assert entities == [(2, 5), (20, 5)]
+    assert state == State_Text
+
+
+def test_unterminated_quote_continues():
+    spans, state = scan("<a href=\"foo")
+    assert unpackState(state)[0] == State_DoubleQuote
+    spans, state = scan("bar\">", state)
+    assert spans[0][:3] == (0, 4, AttributeValue)
+    assert state == State_Text
+
+
+def test_css_properties():
+    spans, state = scan("<style>a { color: red; -webkit-box-flex : 1 }</style>")
+    properties = [(start, length) for start, length, kind, _ in spans if kind == Property]
+    assert properties == [(11, 5), (23, 16)]
+
+
+def test_quotes_in_regex_literals_start_no_string():
+    regex = "/[\"'`/]+\\//g"
+    line = "<script>var r = " + regex + '; var s = "x";</script>'
+    spans, state = scan(line)
+    strings = [line[start:start + length] for start, length, kind, _ in spans if kind == String]
+    assert "".join(strings) == regex + '"x"'
+    assert spans[-1][2] == Tag
+    assert state == State_Text
+
+    # after a name or ')' a '/' divides
+    line = "<script>x = (a) / 2 / b; y = 'z';</script>"
+    strings = [line[start:start + length] for start, length, kind, _ in scan(line)[0] if kind == String]
+    assert "".join(strings) == "'z'"
+
+
+def kinds(text, scanLine):
+    # token kind per character, spans are only cut differently
+    result = [None] * len(text)
+    for start, length, kind, _ in scanLine():
+        result[start:start + length] = [kind] * length
+    return result
+
+
+@pytest.mark.parametrize("line", [
+    '<script>var s = "a b c d e f g h i j k l m n o p"; var y = 1;</script><p>x</p>',
+    "<script>var s = 'a b c d e f g h i j'; // c d e f g h i j k l m</script><p>x</p>",
+    '<style>a { content: "a b c d e f g h i j k l"; color: red }</style><p>x</p>',
+    "<script>if (/a b ' c [d e / f] g h i j/.test(x)) y = 'k l m n o';</script>",
+], ids=["double-quote", "line-comment", "css-string", "regex"])
+def test_segments_continue_the_line(line):
+    segments = splitSegments(line, 12)
+    assert len(segments) > 2
+
+    def scanSegments():
+        spans, state, offset = [], State_Text, 0
+        for segment, continued in segments:
+            segmentSpans, state = scan(segment, state, lineEnd=not continued)
+            spans.extend((start + offset, length, kind, s) for start, length, kind, s in segmentSpans)
+            offset += len(segment)
+        scanSegments.state = state
+        return spans
+
+    assert kinds(line, scanSegments) == kinds(line, lambda: scan(line)[0])
+    assert scanSegments.state == scan(line)[1] == State_Text
+
+
+@pytest.mark.parametrize("binary", [False, True], ids=["text", "bytes"])
+def test_stream_matches_scan(binary):
+    lines = [
+        "<script>" + 'var a="<b>x</b> y"; // c <i>d</i> e ' * 200 + "</script>",
+        "<style>a { content: 'x > y z' } " * 100 + "</style><p title=\"a b\">&amp; c</p>",
+        "<p>" + "&lt;q&gt; " * 300 + "</p>",
+    ]
+    text = "\n".join(lines)
+
+    def scanLines():
+        spans, state, offset = [], State_Text, 0
+        for line in lines:
+            lineSpans, state = scan(line, state)
+            spans.extend((start + offset, length, kind, s) for start, length, kind, s in lineSpans)
+            offset += len(line) + 1
+        return spans
+
+    stream = io.BytesIO(text.encode("utf-8")) if binary else io.StringIO(text)
+    streamed = list(tokenizeStream(stream, chunkSize=64))
+    assert kinds(text, lambda: streamed) == kinds(text, scanLines)
+    assert streamed[-1][3] == scanLines()[-1][3]
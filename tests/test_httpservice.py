@@ -0,0 +1,156 @@
+import json
+import threading
+import http.client
+import concurrent.futures
+
+import pytest
+
+pytest.importorskip("PyQt5.QtWebEngineWidgets")
+
+from pyhtmleditor import httpservice, renderservice
+from pyhtmleditor.pagepool import sandboxPool
+
+# seconds a request may take
+Timeout = 30
+
+
+@pytest.fixture
+def server(qapp):
+    pool = sandboxPool(2)
+    service = httpservice.EditingService(pool)
+    server = httpservice.createServer(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    pool.clear()
+
+
+def request(qapp, server, method, path, body=None, headers=None):
+    """Return (status, content type, body), the GUI thread runs meanwhile"""
+
+    def send():
+        conn = http.client.HTTPConnection(*server.server_address[:2], timeout=Timeout)
+        try:
+            if headers is None:
+                conn.request(method, path, body)
+            else:
+                # the headers as given, without a computed Content-Length
+                conn.putrequest(method, path, skip_accept_encoding=True)
+                for name, value in headers.items():
+                    conn.putheader(name, value)
+                conn.endheaders(body)
+            response = conn.getresponse()
+            return response.status, response.getheader("Content-Type"), response.read()
+        finally:
+            conn.close()
+
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        future = executor.submit(send)
+        while not future.done():
+            qapp.processEvents()
+        return future.result()
+
+
+def post(qapp, server, endpoint, params):
+    status, contentType, body = request(qapp, server, "POST", "/" + endpoint,
+            json.dumps(params).encode("utf-8"))
+    return status, json.loads(body) if contentType == "application/json" else body
+
+
+def test_normalize_runs_commands_but_no_document_scripts(qapp, server):
+    status, result = post(qapp, server, "normalize", {
+        "html": "<p>x</p><script>document.body.appendChild(document.createElement('hr'));</script>",
+        "commands": [["bold", None]],
+        "links": [],
+    })
+    assert status == 200
+    assert "<b>x</b>" in result["html"]
+    assert "<hr>" not in result["html"]
+
+
+Payloads = [
+    ("<script>alert(1)</script>", "alert"),
+    ("<img src=x onerror=alert(1)>", "onerror"),
+    ('<a href="java&#09;script:alert(1)">x</a>', "script:"),
+    ('<a href=" JAVASCRIPT:alert(1)">x</a>', "alert"),
+    ('<a href="vbscript:msgbox(1)">x</a>', "msgbox"),
+    ('<a href="data:text/html,&lt;script&gt;alert(1)&lt;/script&gt;">x</a>', "data:"),
+    ('<img src="data:image/svg+xml,&lt;svg onload=alert(1)&gt;">', "svg"),
+    ("<svg><script>alert(1)</script></svg>", "alert"),
+    ('<svg><a xlink:href="javascript:alert(1)"><text>x</text></a></svg>', "svg"),
+    ('<math><mtext><a href="javascript:alert(1)">x</a></mtext></math>', "math"),
+    ('<noscript><p title="</noscript><img src=x onerror=alert(1)>"></noscript>', "onerror"),
+    ("<template><script>alert(1)</script></template>", "alert"),
+    ('<style>@import "http://evil.example/";</style>', "evil"),
+    ('<p style="background: url(http://evil.example/)">x</p>', "evil"),
+    ('<iframe src="http://evil.example/"></iframe>', "evil"),
+    ('<base href="http://evil.example/">', "evil"),
+    ('<meta http-equiv="refresh" content="0; url=http://evil.example/">', "evil"),
+    ('<form action="http://evil.example/"><input name="password"></form>', "password"),
+    ('<blink><b onclick="alert(1)">kept</b></blink>', "onclick"),
+]
+
+
+@pytest.mark.parametrize("payload, dropped", Payloads)
+def test_sanitize_drops_the_dangerous_parts(qapp, server, payload, dropped):
+    status, result = post(qapp, server, "sanitize", {"html": "<p>before</p>" + payload})
+    assert status == 200
+    assert dropped not in result["html"].lower()
+    assert "<p>before</p>" in result["html"]
+
+
+def test_sanitize_keeps_safe_markup(qapp, server):
+    html = ('<p class="x"><a href="https://example.com/a?b=c">link</a> '
+            '<a href="other.html">relative</a> <b>bold</b></p>'
+            '<img src="data:image/png;base64,iVBORw0KGgo=" alt="dot">')
+    status, result = post(qapp, server, "sanitize", {"html": html})
+    assert status == 200
+    for part in ('class="x"', 'href="https://example.com/a?b=c"', 'href="other.html"',
+            "<b>bold</b>", 'src="data:image/png;base64,iVBORw0KGgo="', 'alt="dot"'):
+        assert part in result["html"]
+    # unknown elements leave their content behind
+    status, result = post(qapp, server, "sanitize", {"html": "<blink><b>kept</b></blink>"})
+    assert "<b>kept</b>" in result["html"] and "blink" not in result["html"]
+
+
+def test_render_returns_a_pdf(qapp, server):
+    status, body = post(qapp, server, "render", {"html": "<p>x</p>", "kind": "pdf"})
+    assert status == 200
+    assert body.startswith(b"%PDF")
+
+
+def test_busy_renderer_answers_503(qapp, server, monkeypatch):
+    monkeypatch.setattr(server.service.renderer, "maxQueue", 0)
+    status, result = post(qapp, server, "render", {"html": "<p>busy</p>", "kind": "pdf"})
+    assert status == 503
+
+
+def test_bad_requests(qapp, server):
+    assert post(qapp, server, "sanitize", {"text": "x"})[0] == 400
+    assert post(qapp, server, "render", {"html": "x", "kind": "gif"})[0] == 400
+    assert post(qapp, server, "unknown", {"html": "x"})[0] == 404
+    assert request(qapp, server, "GET", "/unknown")[0] == 404
+
+
+@pytest.mark.parametrize("length, status", [(None, 411), ("abc", 400), ("-1", 400),
+        (str(httpservice.MaxRequestSize + 1), 413)])
+def test_content_length_is_checked(qapp, server, length, status):
+    headers = {"Content-Type": "application/json"}
+    if length is not None:
+        headers["Content-Length"] = length
+    assert request(qapp, server, "POST", "/sanitize", b"", headers)[0] == status
+
+
+def test_metrics(qapp, server):
+    assert request(qapp, server, "GET", "/health")[:2] == (200, "application/json")
+    post(qapp, server, "sanitize", {"html": "<p>x</p>"})
+    status, contentType, body = request(qapp, server, "GET", "/metrics")
+    metrics = json.loads(body)
+    assert status == 200
+    assert metrics["endpoints"]["sanitize"]["requests"] == 1
+    assert metrics["in_flight"] == 0 and metrics["queue_depth"] == 0
+    assert metrics["pages"] >= 1 and metrics["pages_created"] >= 1
+    assert metrics["render_cache_hits"] == server.service.renderer.hits
+    assert isinstance(server.service.renderer, renderservice.RenderService)
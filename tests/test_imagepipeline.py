@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5.QtGui")
+
+from PyQt5 import QtCore, QtGui
+
+from pyhtmleditor import assets, imagepipeline
+
+
+def makeImage(path, width, height, alpha=False):
+    image = QtGui.QImage(width, height,
+            QtGui.QImage.Format_ARGB32 if alpha else QtGui.QImage.Format_RGB32)
+    image.fill(QtGui.QColor(10, 20, 30, 128 if alpha else 255))
+    assert image.save(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return assets.AssetStore(str(tmp_path / assets.AssetDir))
+
+
+def test_display_size():
+    assert imagepipeline.displaySize(QtCore.QSize(1600, 900)) == QtCore.QSize(800, 450)
+    assert imagepipeline.displaySize(QtCore.QSize(400, 300)) == QtCore.QSize(400, 300)
+    assert imagepipeline.displaySize(QtCore.QSize(8000, 1)) == QtCore.QSize(800, 1)
+    assert imagepipeline.displaySize(QtCore.QSize(300, 200), width=100) == QtCore.QSize(100, 67)
+
+
+def test_needs_scaling(qapp, tmp_path):
+    limit = int(imagepipeline.DisplayWidth * imagepipeline.Slack)
+    assert imagepipeline.needsScaling(makeImage(tmp_path / "wide.png", limit + 1, 10))
+    assert not imagepipeline.needsScaling(makeImage(tmp_path / "slack.png", limit, 10))
+    text = tmp_path / "text.png"
+    text.write_bytes(b"not an image")
+    assert not imagepipeline.needsScaling(str(text))
+
+
+def test_scale_image_makes_a_variant_per_scale(qapp, tmp_path, store):
+    source = makeImage(tmp_path / "photo.png", 2000, 1000)
+    variants = imagepipeline.scaleImage(source, store)
+    assert [scale for path, scale in variants] == [1, 2]
+    for path, scale in variants:
+        assert path.startswith(store.root) and path.endswith(".jpg")
+        assert QtGui.QImageReader(path).size() == QtCore.QSize(800 * scale, 400 * scale)
+
+
+def test_scale_image_skips_upscaling_and_keeps_alpha(qapp, tmp_path, store):
+    source = makeImage(tmp_path / "logo.png", 1200, 600, alpha=True)
+    variants = imagepipeline.scaleImage(source, store)
+    assert [scale for path, scale in variants] == [1]
+    assert variants[0][0].endswith(".png")
+    # the temporary files are gone, only the blobs are left
+    assert sorted(os.listdir(str(tmp_path))) == [assets.AssetDir, "logo.png"]
+
+
+def test_scale_image_rejects_unreadable_files(qapp, tmp_path, store):
+    broken = tmp_path / "broken.jpg"
+    broken.write_bytes(b"not an image")
+    with pytest.raises(ValueError):
+        imagepipeline.scaleImage(str(broken), store)
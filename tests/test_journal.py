@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5.QtCore")
+
+from pyhtmleditor import journal
+
+States = [
+    "<html>\n<body>\n<p>one</p>\n</body>\n</html>",
+    "<html>\n<body>\n<p>one</p>\n<p>two</p>\n</body>\n</html>",
+    "<html>\n<body>\n<p>zwei</p>\n</body>\n</html>",
+]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return journal.journalPath(str(tmp_path / "doc.html"))
+
+
+def recorded(path, states):
+    j = journal.Journal(path)
+    for text in states:
+        j.append(text)
+    return j
+
+
+def test_replay_returns_the_last_state(path):
+    assert os.path.basename(path) == ".doc.html.journal"
+    recorded(path, States)
+    assert journal.Journal(path).replay() == States[-1]
+
+
+def test_torn_or_corrupt_tail_is_ignored(path):
+    recorded(path, States)
+    data = open(path, "rb").read()
+
+    with open(path, "wb") as fd:
+        fd.write(data[:-3])
+    assert journal.Journal(path).replay() == States[-2]
+
+    corrupt = bytearray(data)
+    corrupt[-1] ^= 0xff
+    with open(path, "wb") as fd:
+        fd.write(bytes(corrupt))
+    assert journal.Journal(path).replay() == States[-2]
+
+    with open(path, "wb") as fd:
+        fd.write(b"not a journal")
+    assert journal.Journal(path).replay() is None
+
+
+def test_patches_are_compacted(path, monkeypatch):
+    monkeypatch.setattr(journal, "MaxPatches", 3)
+    states = ["<p>%d</p>" % i for i in range(5)]
+    j = recorded(path, states[:4])
+    assert j.patches == 3
+    j.append(states[4])
+    assert j.patches == 0
+    assert os.path.getsize(path) == len(journal.Magic + journal._record(journal.Snapshot, states[4]))
+    assert journal.Journal(path).replay() == states[4]
+
+
+def test_unchanged_state_appends_nothing(path):
+    j = recorded(path, States[:1])
+    size = os.path.getsize(path)
+    j.append(States[0])
+    assert os.path.getsize(path) == size
+    j.discard()
+    assert not os.path.exists(path)
@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+pytest.importorskip("PyQt5.QtWebEngineWidgets")
+
+from PyQt5.QtWebEngineWidgets import QWebEnginePage
+
+from pyhtmleditor.pagepool import PagePool
+
+# seconds to wait for a page to come back
+Timeout = 10
+
+
+def waitFor(qapp, condition):
+    deadline = time.monotonic() + Timeout
+    while not condition() and time.monotonic() < deadline:
+        qapp.processEvents()
+    assert condition()
+
+
+@pytest.fixture
+def pool(qapp):
+    pool = PagePool(maxPages=1)
+    yield pool
+    pool.clear()
+    pool.deleteLater()
+
+
+def test_released_pages_serve_the_waiting(qapp, pool):
+    pages = []
+    pool.acquire(pages.append)
+    pool.acquire(pages.append)
+    assert len(pages) == 1 and len(pool.waiting) == 1
+
+    pool.release(pages[0])
+    assert pool.size() == 1
+    waitFor(qapp, lambda: len(pages) == 2)
+    assert pages[0] is pages[1]
+    assert (pool.created, pool.reused) == (1, 1)
+    assert not pool.resetting
+
+
+def test_reset_keeps_the_slots_of_others(qapp, pool):
+    pages = []
+    pool.acquire(pages.append)
+    loads = []
+    pages[0].loadFinished.connect(loads.append)
+    pool.release(pages[0])
+    waitFor(qapp, lambda: pool.idle)
+    # the slot saw the blank page come in, only the pool's one is gone
+    assert loads == [True]
+    pages[0].loadFinished.disconnect(loads.append)
+
+
+def test_hung_reset_replaces_the_page(qapp):
+    pool = PagePool(maxPages=1, minPages=1, resetTimeout=10)
+    pages = []
+    pool.acquire(pages.append)
+    pool.acquire(pages.append)
+    # the blank page never comes in
+    pages[0].setUrl = lambda url: None
+    pool.release(pages[0])
+    waitFor(qapp, lambda: len(pages) == 2)
+    assert pages[1] is not pages[0]
+    assert (pool.hung, pool.created) == (1, 2)
+    assert not pool.resetting
+    pool.release(pages[1])
+    waitFor(qapp, lambda: pool.idle)
+    pool.clear()
+
+
+def test_idle_pages_are_evicted(qapp):
+    pool = PagePool(maxPages=2, minPages=1, idleTimeout=0)
+    pages = []
+    pool.acquire(pages.append)
+    pool.acquire(pages.append)
+    for page in pages:
+        pool.release(page)
+    waitFor(qapp, lambda: len(pool.idle) == 2)
+    pool.evictIdle()
+    # the most recently used one stays warm
+    assert [page for page, used in pool.idle] == [pages[1]]
+    assert pool.evicted == 1
+    pool.clear()
+
+
+def test_crashed_pages_are_not_reused(qapp, pool):
+    pages = []
+    pool.acquire(pages.append)
+    pool.acquire(pages.append)
+    pages[0].renderProcessTerminated.emit(QWebEnginePage.CrashedTerminationStatus, 11)
+    pool.release(pages[0])
+    assert len(pages) == 2 and pages[1] is not pages[0]
+    assert pool.created == 2 and pool.size() == 1
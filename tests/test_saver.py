@@ -0,0 +1,60 @@
+import os
+import stat
+
+import pytest
+
+pytest.importorskip("PyQt5.QtCore")
+
+from pyhtmleditor import saver
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(str(path)).st_mode)
+
+
+def test_new_files_get_the_umask_mode(tmp_path):
+    target = tmp_path / "new.html"
+    saver.writeAtomic(str(target), b"<p>x</p>")
+    assert target.read_bytes() == b"<p>x</p>"
+    umask = os.umask(0)
+    os.umask(umask)
+    assert mode(target) == 0o666 & ~umask
+
+
+def test_replaced_files_keep_their_mode(tmp_path):
+    target = tmp_path / "old.html"
+    target.write_bytes(b"old")
+    os.chmod(str(target), 0o640)
+    saver.writeAtomic(str(target), b"new")
+    assert target.read_bytes() == b"new"
+    assert mode(target) == 0o640
+
+
+def test_failed_write_leaves_the_file_alone(tmp_path, monkeypatch):
+    target = tmp_path / "doc.html"
+    target.write_bytes(b"old")
+    monkeypatch.setattr(saver, "WriteChunk", 4)
+
+    def progress(written, total):
+        if written > 4:
+            raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        saver.writeAtomic(str(target), b"new contents", progress)
+    assert target.read_bytes() == b"old"
+    assert os.listdir(str(tmp_path)) == ["doc.html"]
+
+
+def test_data_and_rename_are_synced(tmp_path, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def recordingFsync(fd):
+        synced.append(stat.S_ISDIR(os.fstat(fd).st_mode))
+        fsync(fd)
+
+    monkeypatch.setattr(os, "fsync", recordingFsync)
+    saver.writeAtomic(str(tmp_path / "doc.html"), b"x")
+    # the temporary file, then the directory holding the rename
+    expected = [False, True] if hasattr(os, "O_DIRECTORY") else [False]
+    assert synced == expected
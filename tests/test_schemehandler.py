@@ -0,0 +1,112 @@
+import os
+
+import pytest
+
+pytest.importorskip("PyQt5.QtWebEngineCore")
+
+from PyQt5 import QtCore
+
+from pyhtmleditor import schemehandler
+
+
+@pytest.fixture
+def handler(qapp):
+    return schemehandler.DocSchemeHandler()
+
+
+@pytest.mark.parametrize("name", ["page.html", "with space.html", "ü.html", "a#b?c.html", "100%41.html"])
+def test_url_round_trip(tmp_path, name):
+    fileName = str(tmp_path / name)
+    url = schemehandler.urlForFile(fileName)
+    assert url.scheme() == schemehandler.Scheme.decode()
+    assert schemehandler.fileForUrl(url) == fileName
+    # the document marker does not change the file
+    assert schemehandler.fileForUrl(schemehandler.urlForFile(fileName, document=True)) == fileName
+
+
+def test_only_files_below_a_root_are_allowed(tmp_path, handler):
+    root = tmp_path / "root"
+    (root / "sub").mkdir(parents=True)
+    (tmp_path / "secret.txt").write_text("x")
+    handler.allow(str(root))
+
+    assert handler.isAllowed(str(root / "page.html"))
+    assert handler.isAllowed(str(root / "sub" / "image.png"))
+    assert not handler.isAllowed(str(tmp_path / "secret.txt"))
+    assert not handler.isAllowed(str(tmp_path / "rootless.html"))
+
+    url = QtCore.QUrl(schemehandler.urlForFile(str(root)).toString() + "/../secret.txt")
+    assert not handler.isAllowed(schemehandler.fileForUrl(url))
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="no symbolic links")
+def test_links_out_of_a_root_are_denied(tmp_path, handler):
+    root = tmp_path / "root"
+    root.mkdir()
+    (tmp_path / "secret.txt").write_text("x")
+    (root / "page.html").write_text("<p>x</p>")
+    os.symlink(str(tmp_path / "secret.txt"), str(root / "link.txt"))
+    os.symlink(str(tmp_path), str(root / "up"))
+    handler.allow(str(root))
+
+    assert handler.isAllowed(str(root / "page.html"))
+    assert not handler.isAllowed(str(root / "link.txt"))
+    assert not handler.isAllowed(str(root / "up" / "secret.txt"))
+
+
+def test_documents_are_html_whatever_their_name(tmp_path, handler):
+    fileName = str(tmp_path / "page.php")
+    info = QtCore.QFileInfo(fileName)
+    assert handler.mimeType(schemehandler.urlForFile(fileName, document=True), info) == b"text/html"
+    image = QtCore.QFileInfo(str(tmp_path / "image.png"))
+    assert handler.mimeType(schemehandler.urlForFile(image.filePath()), image) == b"image/png"
+
+
+def test_contents_get_urls_of_their_own(tmp_path, handler):
+    fileName = str(tmp_path / "page.html")
+    first = handler.setContent(fileName, b"<p>one</p>")
+    second = handler.setContent(fileName, b"<p>two</p>")
+    assert first != second
+    for url in (first, second):
+        assert schemehandler.fileForUrl(url) == fileName
+        assert handler.mimeType(url, QtCore.QFileInfo(fileName)) == b"text/html"
+
+    handler.removeContent(first)
+    assert list(handler.contents.values()) == [b"<p>two</p>"]
+    handler.removeContent(second)
+    assert not handler.contents
+    # the file itself is no content
+    handler.removeContent(schemehandler.urlForFile(fileName, document=True))
+
+
+def test_contents_are_served_until_removed(qapp, tmp_path):
+    QtWebEngineWidgets = pytest.importorskip("PyQt5.QtWebEngineWidgets")
+    profile = QtWebEngineWidgets.QWebEngineProfile()
+    handler = schemehandler.install(profile)
+    page = QtWebEngineWidgets.QWebEnginePage(profile)
+    fileName = tmp_path / "page.html"
+    fileName.write_text("<p>disk</p>")
+    handler.allow(str(tmp_path))
+
+    def load(url):
+        loop = QtCore.QEventLoop()
+        results = []
+        page.loadFinished.connect(loop.quit)
+        page.load(url)
+        loop.exec_()
+        page.loadFinished.disconnect(loop.quit)
+        page.toHtml(lambda html: (results.append(html), loop.quit()))
+        loop.exec_()
+        return results[0]
+
+    first = handler.setContent(str(fileName), b"<p>one</p>")
+    second = handler.setContent(str(fileName), b"<p>two</p>")
+    assert "two" in load(second)
+    assert "one" in load(first)
+    # served again on reload
+    assert "one" in load(first)
+    handler.removeContent(first)
+    assert "one" not in load(first)
+    assert "disk" in load(schemehandler.urlForFile(str(fileName), document=True))
+    # the page goes before its profile
+    del page
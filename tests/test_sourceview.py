@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("PyQt5.QtWidgets")
+
+from PyQt5 import QtGui
+
+from pyhtmleditor import sourcetext
+from pyhtmleditor.highlighter import replaceLines
+from pyhtmleditor.sourceview import SourceView
+
+Line = '<p class="a">' + "text " * 40 + "</p>"
+
+
+def sourceView(text, limit):
+    view = SourceView()
+    document = view.document()
+    replaceLines(document, 0, document.blockCount(), sourcetext.splitSegments(text, limit))
+    return view
+
+
+def copied(view, start, end):
+    cursor = QtGui.QTextCursor(view.document())
+    cursor.setPosition(start)
+    cursor.setPosition(end, QtGui.QTextCursor.KeepAnchor)
+    view.setTextCursor(cursor)
+    return view.createMimeDataFromSelection().text()
+
+
+def test_copy_joins_the_segments_of_a_line(qapp):
+    text = "<html>\n" + Line + "\n" + Line + "\n</html>"
+    view = sourceView(text, 50)
+    assert view.document().blockCount() > 4
+    assert copied(view, 0, view.document().characterCount() - 1) == text
+
+
+def test_copy_of_a_part_crossing_segments(qapp):
+    view = sourceView(Line, 50)
+    second = view.document().begin().next()
+    start = second.position() - 10
+    end = second.position() + 10
+    # positions in the second block count the break before it
+    assert copied(view, start, end) == Line[start:end - 1]
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("PyQt5.QtTest")
+
+from PyQt5 import QtTest
+
+from pyhtmleditor.throttle import Throttle
+
+Interval = 20
+
+
+@pytest.fixture
+def throttle(qapp):
+    calls = []
+    throttle = Throttle(lambda: calls.append(throttle.received), Interval)
+    throttle.calls = calls
+    yield throttle
+    throttle.timer.stop()
+
+
+def test_first_event_calls_at_once(throttle):
+    throttle.trigger()
+    assert throttle.calls == [1]
+    assert (throttle.received, throttle.processed, throttle.dropped()) == (1, 1, 0)
+
+
+def test_burst_is_merged_into_a_trailing_call(throttle):
+    spy = QtTest.QSignalSpy(throttle.timer.timeout)
+    for i in range(10):
+        throttle.trigger()
+    assert throttle.calls == [1]
+    assert throttle.dropped() == 8
+
+    assert spy.wait(Interval * 10)
+    assert throttle.calls == [1, 10]
+    assert (throttle.received, throttle.processed, throttle.dropped()) == (10, 2, 8)
+
+    # nothing pending, the burst is over
+    assert spy.wait(Interval * 10)
+    assert throttle.calls == [1, 10]
+
+
+def test_steady_events_call_once_per_interval(throttle):
+    for i in range(10):
+        throttle.trigger()
+        QtTest.QTest.qWait(Interval * 3 // 2)
+    # every event but those merged within one interval gets its call
+    assert len(throttle.calls) >= 5
+    assert throttle.calls[-1] == 10
+
+
+def test_flush_makes_the_pending_call(throttle):
+    throttle.trigger()
+    throttle.trigger()
+    throttle.flush()
+    assert throttle.calls == [1, 2]
+    throttle.flush()
+    assert throttle.calls == [1, 2]
+    throttle.resetCounters()
+    assert (throttle.received, throttle.processed) == (0, 0)